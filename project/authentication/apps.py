@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        # Register the token cache invalidation signals
+        from . import signals
@@ -0,0 +1,137 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from project.caches import is_process_local
+from project.instrumentation import timed_method
+from project.metrics import count_cache_lookup
+from project.routers import route_reads
+
+
+# Bounded, thread-safe LRU whose entries expire a fixed number of seconds after being stored
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_cache_settings():
+    return settings.TOKEN_AUTH_CACHE
+
+
+def token_cache_key(key):
+    # Hash the token so it never appears in the shared cache in clear text
+    return 'authtoken:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def password_cache_key(key):
+    return 'authpassword:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+# Tokens recently resolved by this process
+local_tokens = LRUCache(
+    maxsize=get_cache_settings()['LOCAL_MAXSIZE'],
+    ttl=get_cache_settings()['LOCAL_TTL'],
+)
+
+
+# The cache shared by every process, None when it is process-local. Deleting a token could
+# not clear the other processes' copies, so tokens and passwords are then not cached there.
+def get_shared_cache():
+    cache = caches[get_cache_settings()['CACHE']]
+    return None if is_process_local(cache) else cache
+
+
+# Forget a token everywhere it is cached, so it has to be looked up again, along with
+# the password remembered for it at login
+def invalidate_token(key):
+    cache_key = token_cache_key(key)
+    local_tokens.delete(cache_key)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete_many([cache_key, password_cache_key(key)])
+
+
+# TokenAuthentication resolving tokens through a per-process LRU, then the shared cache,
+# and only then the database. Cached tokens are invalidated by the signals in signals.py
+# when the token or its user is deleted or changed.
+class CachedTokenAuthentication(TokenAuthentication):
+    # Once the user is known, their reads may go to a replica, see project/routers.py
+    @timed_method('auth')
+    def authenticate(self, request):
+        user_auth_tuple = super().authenticate(request)
+        if user_auth_tuple is not None:
+            route_reads(user_auth_tuple[0].id)
+        return user_auth_tuple
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+
+        # Each request gets its own copy of the token and user, so nothing is shared between threads
+        pickled_token = local_tokens.get(cache_key)
+        count_cache_lookup('tokens_local', pickled_token is not None)
+        if pickled_token is None:
+            shared_cache = get_shared_cache()
+            if shared_cache is not None:
+                pickled_token = shared_cache.get(cache_key)
+                count_cache_lookup('tokens_shared', pickled_token is not None)
+            if pickled_token is None:
+                token = self.get_token(key)
+                pickled_token = pickle.dumps(token)
+                if shared_cache is not None:
+                    shared_cache.set(cache_key, pickled_token, get_cache_settings()['TIMEOUT'])
+            local_tokens.set(cache_key, pickled_token)
+
+        token = pickle.loads(pickled_token)
+        return (token.user, token)
+
+    def get_token(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return token
@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .authentication import get_shared_cache, password_cache_key
+
+
+class PoolFull(Exception):
+    pass
+
+
+# Bounded pool running password hashing off the request thread. Hashing releases the GIL,
+# so the workers hash in parallel while the event loop keeps serving other requests.
+# Once every worker is busy and max_pending hashes are queued, new work is rejected.
+class HashingPool:
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='password-hashing')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    async def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolFull()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool(
+    max_workers=settings.PASSWORD_HASHING['MAX_WORKERS'],
+    max_pending=settings.PASSWORD_HASHING['MAX_PENDING'],
+)
+
+
+# A returning user's password is checked against a keyed digest remembered for their token,
+# which is far cheaper than running the password hasher again
+def password_digest(token_key, password):
+    return salted_hmac('authentication.hashing.password_digest', token_key + password,
+                       algorithm='sha256').hexdigest()
+
+
+# Passwords are only remembered in a shared cache, so a password change forgets them in every process
+async def remember_password(token_key, password):
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        await shared_cache.aset(password_cache_key(token_key), password_digest(token_key, password),
+                                settings.PASSWORD_HASHING['REMEMBER_TIMEOUT'])
+
+
+async def is_remembered_password(token_key, password):
+    shared_cache = get_shared_cache()
+    if shared_cache is None:
+        return False
+    digest = await shared_cache.aget(password_cache_key(token_key))
+    return digest is not None and constant_time_compare(digest, password_digest(token_key, password))
@@ -1,7 +1,9 @@
-from rest_framework import serializers
 from django.contrib.auth.models import User
+from project.serializers import ModelSerializer
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
-        fields = '__all__'
\ No newline at end of file
+        # Everything but the password hash
+        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active', 'is_superuser',
+                  'last_login', 'date_joined', 'groups', 'user_permissions']
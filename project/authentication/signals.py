@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+
+
+# Invalidate right away, and again once the change is committed, in case a concurrent
+# request cached the old row in between
+def revoke(key):
+    invalidate_token(key)
+    transaction.on_commit(lambda: invalidate_token(key))
+
+
+# Revoke a token as soon as it is deleted, including when its user is deleted
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    revoke(instance.key)
+
+
+# Drop the cached copy of the user, e.g. when the account is deactivated
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        revoke(key)
@@ -1,14 +1,26 @@
 from django.urls import reverse
 from rest_framework.test import APITestCase
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, identify_hasher
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from django.core.cache import cache
+from django.test import override_settings
+from unittest import mock
+from .authentication import CachedTokenAuthentication, local_tokens, token_cache_key
+from .hashing import HashingPool
+from project.tests import PROCESS_LOCAL_CACHES, SHARED_CACHES
 
 # Reusable code to initialize user and token
 
 
+@override_settings(CACHES=SHARED_CACHES)
 class AuthAPIBaseTestCase(APITestCase):
     def setUp(self):  # Create test user and get its token
+        local_tokens.clear()
+        cache.clear()
         self.user = User.objects.create_user(
             username='testuser', password='testpassword')
         self.token = Token.objects.create(user=self.user)
@@ -54,11 +66,22 @@ class UserRegistrationViewTest(APITestCase):
         user = User.objects.filter(username='testuser').first()
         self.assertIsNone(user)  # Check that the user does not exist
 
+    # Test that a username equal to an existing one once normalized is rejected
+    def test_normalized_duplicate(self):
+        User.objects.create_user(username='fish', password='testpassword')
+        url = reverse('register-user')
+        data = {'username': '\ufb01sh', 'password': 'testpassword'}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Username already exists')
+
 # Test User login
 
 
+@override_settings(CACHES=SHARED_CACHES)
 class UserLoginViewTest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username='testuser', password='testpassword')
         self.token = Token.objects.create(user=self.user)
@@ -77,6 +100,56 @@ class UserLoginViewTest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_unknown_user(self):
+        self.client.credentials()
+        url = reverse('login-user')
+        data = {'username': 'unknownuser', 'password': 'testpassword'}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_returning_user(self):
+        url = reverse('login-user')
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        self.client.post(url, data, format='json')
+
+        # Logging in again with the same token and password skips the password hasher
+        with mock.patch.object(HashingPool, 'run') as run:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['token'], self.token.key)
+        run.assert_not_called()
+
+    # Test that a password hashed with outdated settings is hashed again on login
+    def test_outdated_hash(self):
+        self.user.password = PBKDF2PasswordHasher().encode('testpassword', 'salt', iterations=1000)
+        self.user.save(update_fields=['password'])
+        url = reverse('login-user')
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('testpassword'))
+        self.assertFalse(identify_hasher(self.user.password).must_update(self.user.password))
+
+    # Test that failed logins are reported to user_login_failed receivers
+    def test_login_failed_signal(self):
+        receiver = mock.Mock()
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        url = reverse('login-user')
+        data = {'username': 'testuser', 'password': 'wrongpassword'}
+        self.client.post(url, data, format='json')
+        receiver.assert_called_once()
+        self.assertEqual(receiver.call_args.kwargs['credentials'], {'username': 'testuser'})
+
+    def test_pool_full(self):
+        url = reverse('login-user')
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        with mock.patch('authentication.views.hashing_pool', HashingPool(max_workers=1, max_pending=-1)):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
 # Test User deletion
 
 
@@ -94,6 +167,15 @@ class UserDeleteViewTest(APITestCase):
         self.assertFalse(User.objects.filter(
             username='testuser').exists())
 
+    def test_token_revoked(self):
+        url = reverse('delete-user')
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The cached token must not outlive the account
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     def test_invalid_token(self):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + 'invalidtoken')
         url = reverse('delete-user')
@@ -105,3 +187,99 @@ class UserDeleteViewTest(APITestCase):
         url = reverse('delete-user')
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# Test cached token lookups
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+    def test_cached_lookup(self):
+        with self.assertNumQueries(1):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        # Later lookups are answered from the cache
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_shared_cache_lookup(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        local_tokens.clear()
+
+        # Another process finds the token in the shared cache
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_invalid_token(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials('invalidtoken')
+
+    def test_deleted_token(self):
+        key = self.token.key
+        self.authentication.authenticate_credentials(key)
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(key)
+
+    def test_deactivated_user(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    # Test that tokens are only kept in the shared cache by default, so deleting them from
+    # any process takes effect in every other one at once
+    def test_no_local_cache(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        self.assertIsNone(local_tokens.get(token_cache_key(self.token.key)))
+
+    # Test that tokens are looked up in the database every time without a shared cache, where
+    # deleting them could not clear the other processes' copies
+    @override_settings(CACHES=PROCESS_LOCAL_CACHES)
+    def test_process_local_cache(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(1):
+            self.authentication.authenticate_credentials(self.token.key)
+
+# Test the admin user list
+
+
+class UserListViewTest(APITestCase):
+    def test_pagination(self):
+        for i in range(3):
+            User.objects.create(username=f'user{i}')
+
+        url = reverse('list-users')
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['username'] for user in response.data['results']], ['user2', 'user1'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([user['username'] for user in response.data['results']], ['user0'])
+        self.assertIsNone(response.data['next'])
+
+    # Test that users are listed in a fixed number of queries, without their password hash
+    def test_list(self):
+        for i in range(5):
+            User.objects.create_user(username=f'user{i}', password='testpassword')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('list-users'))
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertNotIn('password', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['groups'], [])
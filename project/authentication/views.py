@@ -1,5 +1,5 @@
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import Throttled
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
@@ -7,29 +7,43 @@ from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.hashers import check_password, make_password
+from project.pagination import IdCursorPagination
+from project.views import AsyncAPIView
+from .authentication import CachedTokenAuthentication
+from .hashing import PoolFull, hashing_pool, is_remembered_password, remember_password
 from .serializers import UserSerializer
 
 # Register a user for an account
 
 
-class UserRegistrationView(APIView):
+class UserRegistrationView(AsyncAPIView):
     permission_classes = [AllowAny]
 
-    def post(self, request):
+    async def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
 
         if not username or not password:
             return Response({'error': 'Please provide username and password'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if User.objects.filter(username=username).exists():
+        # Usernames are stored normalized, so names differing only before normalization clash
+        username = User.normalize_username(username)
+        if await User.objects.filter(username=username).aexists():
             return Response({'error': 'Username already exists'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Hash the password off the request thread
         try:
-            user = User.objects.create_user(
-                username=username, password=password)
-            token, created = Token.objects.get_or_create(user=user)
+            hashed_password = await hashing_pool.run(make_password, password)
+        except PoolFull:
+            raise Throttled(wait=1)
+
+        try:
+            user = User(username=username, password=hashed_password)
+            await user.asave()
+            token, created = await Token.objects.aget_or_create(user=user)
+            await remember_password(token.key, password)
             return Response({'token': token.key}, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -37,31 +51,59 @@ class UserRegistrationView(APIView):
 # Log into user's account
 
 
-class UserLoginView(APIView):
+class UserLoginView(AsyncAPIView):
     permission_classes = [AllowAny]
 
-    def post(self, request):
+    async def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
 
         if not username or not password:
             return Response({'error': 'Please provide username and password'}, status=status.HTTP_400_BAD_REQUEST)
+        username = User.normalize_username(username)
+
+        # A returning user sending their token along with the password they last logged in
+        # with gets the token back without hashing the password again
+        if (request.auth is not None and request.user.username == username
+                and await is_remembered_password(request.auth.key, password)):
+            return Response({'token': request.auth.key}, status=status.HTTP_201_CREATED)
 
-        user = authenticate(username=username, password=password)
-        if user is not None:
+        user = await User.objects.filter(username=username).afirst()
+
+        # Check the password off the request thread. Like User.check_password(), passwords
+        # hashed with outdated hasher settings are hashed again and saved.
+        outdated = []
+        try:
+            if user is None:
+                # Hash anyway, so unknown usernames take as long as wrong passwords
+                await hashing_pool.run(make_password, password)
+                valid_password = False
+            else:
+                valid_password = await hashing_pool.run(check_password, password, user.password, outdated.append)
+            if outdated:
+                await hashing_pool.run(user.set_password, password)
+        except PoolFull:
+            raise Throttled(wait=1)
+
+        if valid_password and user.is_active:
+            if outdated:
+                await user.asave(update_fields=['password'])
             try:
-                token, created = Token.objects.get_or_create(user=user)
+                token, created = await Token.objects.aget_or_create(user=user)
+                await remember_password(token.key, password)
                 return Response({'token': token.key}, status=status.HTTP_201_CREATED)
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         else:
+            # As django.contrib.auth.authenticate() does, for e.g. lockout or auditing receivers
+            await user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
             return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
 
 # Delete user's account
 
 
 class UserDeleteView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
@@ -74,5 +116,7 @@ class UserDeleteView(APIView):
 
 
 class UserListView(ListAPIView):
-    queryset = User.objects.all()
+    # One query per page for each many-to-many field, rather than two per user
+    queryset = User.objects.prefetch_related('groups', 'user_permissions')
     serializer_class = UserSerializer
+    pagination_class = IdCursorPagination
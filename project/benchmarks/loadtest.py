@@ -0,0 +1,128 @@
+"""
+Load test for a running server.
+
+Sends GET requests to one URL from many concurrent keep-alive connections and reports
+the throughput and latency percentiles, e.g. to compare serving modes:
+
+    python benchmarks/loadtest.py http://localhost:8000/workouts/my-workouts/ \
+        --token <token> --concurrency 32 --duration 10
+
+Given the process ids of the server's workers with --pid, it also reports their peak
+resident memory and thread count, read from /proc on Linux. Concurrency per worker at a
+fixed memory budget compares a single threaded worker, e.g. GUNICORN_THREADS=8, with a single
+ASGI worker:
+
+    WEB_CONCURRENCY=1 GUNICORN_THREADS=8 gunicorn
+    WEB_CONCURRENCY=1 GUNICORN_APP=project.asgi:application \
+        GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn
+"""
+
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(latencies, percent):
+    if not latencies:
+        return 0.0
+    index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+    return latencies[index]
+
+
+# Peak resident memory in KiB and thread count of the processes, summed over them
+def sample_processes(pids, deadline, peaks):
+    while time.monotonic() < deadline:
+        rss = threads = 0
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/status') as status:
+                    for line in status:
+                        name, _, value = line.partition(':')
+                        if name == 'VmRSS':
+                            rss += int(value.split()[0])
+                        elif name == 'Threads':
+                            threads += int(value)
+            except OSError:
+                continue
+        peaks['rss'] = max(peaks['rss'], rss)
+        peaks['threads'] = max(peaks['threads'], threads)
+        time.sleep(0.05)
+
+
+def run_client(url, headers, deadline, latencies, errors, lock):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    client_latencies = []
+    client_errors = 0
+
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                client_errors += 1
+        except (OSError, http.client.HTTPException):
+            client_errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        client_latencies.append(time.perf_counter() - started)
+
+    connection.close()
+    with lock:
+        latencies.extend(client_latencies)
+        errors.append(client_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a URL of a running server.')
+    parser.add_argument('url')
+    parser.add_argument('--token', help='Token sent in the Authorization header')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run for')
+    parser.add_argument('--pid', type=int, nargs='*', default=[], help='Server worker processes to sample')
+    args = parser.parse_args()
+
+    headers = {'Connection': 'keep-alive'}
+    if args.token:
+        headers['Authorization'] = 'Token ' + args.token
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    clients = [
+        threading.Thread(target=run_client, args=(args.url, headers, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    peaks = {'rss': 0, 'threads': 0}
+    if args.pid:
+        clients.append(threading.Thread(target=sample_processes, args=(args.pid, deadline, peaks)))
+    started = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f'requests:     {len(latencies)}')
+    print(f'errors:       {sum(errors)}')
+    print(f'requests/s:   {len(latencies) / elapsed:.1f}')
+    if latencies:
+        print(f'latency mean: {statistics.mean(latencies) * 1000:.1f} ms')
+        for percent in (50, 95, 99):
+            print(f'latency p{percent}:  {percentile(latencies, percent) * 1000:.1f} ms')
+    if args.pid:
+        print(f'server RSS:   {peaks["rss"] / 1024:.1f} MiB peak')
+        print(f'threads:      {peaks["threads"]} peak')
+
+
+if __name__ == '__main__':
+    main()
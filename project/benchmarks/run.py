@@ -0,0 +1,257 @@
+"""
+Benchmarks every endpoint of the workouts and authentication APIs against the seeded
+database (see benchmarks/seed.py), run from the project directory:
+
+    python benchmarks/run.py --save-baseline     # record benchmarks/baseline.json
+    python benchmarks/run.py                     # compare against it
+
+Requests go through Django's test client in this process, as the first seeded user.
+Each endpoint is timed over --iterations requests for latency percentiles, then run once
+more to count queries and once more under tracemalloc for the peak memory allocated.
+Cached responses are invalidated before each request unless the endpoint name says it
+is cached. Everything runs inside one transaction that is rolled back at the end, so
+writes leave the data as seeded, but their latency leaves out the commit.
+
+The run fails when an endpoint returns an unexpected status, makes more queries than
+the baseline, or takes more than --tolerance times the baseline p95 latency or memory.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from benchmarks.seed import BENCHMARK_PASSWORD, username
+from workouts.cache import bump_generation
+from workouts.models import Exercise, Set, Workout
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Endpoint:
+    def __init__(self, name, method, url, expected_status=200, data=None, cached=False, token=True):
+        self.name = name
+        self.method = method
+        # url, data and token may be callables, called before each request outside the timing
+        self.url = url
+        self.data = data
+        self.expected_status = expected_status
+        self.cached = cached
+        # True sends the benchmark user's token, False no token
+        self.token = token
+
+    # Builds the next request, returning a function that sends it and returns its latency
+    def prepare(self, client, user):
+        url = self.url() if callable(self.url) else self.url
+        data = self.data() if callable(self.data) else self.data
+        token = self.token() if callable(self.token) else user.auth_token.key if self.token else None
+        headers = {'Authorization': 'Token ' + token} if token else {}
+        if not self.cached:
+            bump_generation(user.id)
+
+        def send():
+            started = time.perf_counter()
+            response = getattr(client, self.method)(url, data=data, content_type='application/json', headers=headers)
+            # Streaming responses are only done once they have been read
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+
+            if response.status_code != self.expected_status:
+                raise RuntimeError(f'{self.name} returned {response.status_code}, expected {self.expected_status}')
+            return elapsed
+
+        return send
+
+
+def endpoints(user):
+    workout = Workout.objects.filter(user=user).order_by('id').first()
+    exercises = list(Exercise.objects.filter(workout=workout).order_by('id'))
+    exercise = exercises[0]
+    exercise_data = [
+        {'name': 'Exercise', 'current_weight': 100, 'target_sets': 3, 'target_reps': 10, 'weight_modifier': 5}
+    ] * len(exercises)
+    counter = iter(range(10 ** 9))
+
+    def new_workout():
+        return reverse('modify-delete-workout', kwargs={'workout_id': Workout.objects.create(
+            user=user, name='Workout').id})
+
+    def new_set():
+        return reverse('delete-set', kwargs={'set_id': Set.objects.create(
+            user=user, exercise=exercise, weight=100, reps=10).id})
+
+    def new_user_token():
+        new_user = User.objects.create_user(f'bench-delete-{next(counter)}')
+        return Token.objects.create(user=new_user).key
+
+    def sync_cursor():
+        return signing.dumps((timezone.now() - timedelta(hours=1)).isoformat(), salt='workouts.sync')
+
+    return [
+        # Authentication
+        Endpoint('register', 'post', reverse('register-user'), 201,
+                 lambda: {'username': f'bench-register-{next(counter)}', 'password': BENCHMARK_PASSWORD}, token=False),
+        Endpoint('login', 'post', reverse('login-user'), 201,
+                 {'username': user.username, 'password': BENCHMARK_PASSWORD}, token=False),
+        Endpoint('login remembered', 'post', reverse('login-user'), 201,
+                 {'username': user.username, 'password': BENCHMARK_PASSWORD}),
+        Endpoint('delete user', 'delete', reverse('delete-user'), token=new_user_token),
+        Endpoint('users list', 'get', reverse('list-users')),
+
+        # Workouts
+        Endpoint('create workout', 'post', reverse('create-workout'), 201,
+                 {'name': 'Workout', 'exercises': exercise_data}),
+        Endpoint('my workouts', 'get', reverse('get-my-workouts')),
+        Endpoint('my workouts cached', 'get', reverse('get-my-workouts'), cached=True),
+        Endpoint('my workouts expanded', 'get', reverse('get-my-workouts') + '?expand=last_session'),
+        Endpoint('workout exercises', 'get', reverse('get-workout-exercises', kwargs={'workout_id': workout.id})),
+        Endpoint('update workout', 'put', reverse('modify-delete-workout', kwargs={'workout_id': workout.id}), 200,
+                 {'name': workout.name, 'exercises': [
+                     {'id': e.id, 'name': e.name, 'current_weight': e.current_weight + 5, 'target_sets': e.target_sets,
+                      'target_reps': e.target_reps, 'weight_modifier': e.weight_modifier} for e in exercises
+                 ]}),
+        Endpoint('delete workout', 'delete', new_workout, 204),
+        Endpoint('exercise sets', 'get', reverse('create-get-sets', kwargs={'exercise_id': exercise.id})),
+        Endpoint('create sets', 'post', reverse('create-get-sets', kwargs={'exercise_id': exercise.id}), 201,
+                 [{'weight': 100, 'reps': 10}] * 5),
+        Endpoint('delete set', 'delete', new_set, 204),
+        Endpoint('summary', 'get', reverse('workout-summary')),
+        Endpoint('summary aggregates', 'get', reverse('workout-summary') + '?aggregates=true'),
+        Endpoint('progress', 'get', reverse('progress-exercises')),
+        Endpoint('progress exercises', 'put', reverse('progress-exercises'), 200,
+                 {'exercises': [e.id for e in exercises]}),
+        Endpoint('export', 'get', reverse('export-sets')),
+        Endpoint('sync', 'get', reverse('sync')),
+        Endpoint('personal records', 'get', reverse('personal-records')),
+        Endpoint('training volume', 'get', reverse('training-volume') + '?period=day'),
+        Endpoint('sync delta', 'get', lambda: reverse('sync') + '?cursor=' + sync_cursor()),
+        Endpoint('workouts list', 'get', reverse('workouts-list')),
+        Endpoint('exercises list', 'get', reverse('exercises-list')),
+        Endpoint('sets list', 'get', reverse('sets-list')),
+    ]
+
+
+def measure(endpoint, client, user, iterations):
+    # Warm up, so caches and lazy imports do not count against the first request
+    endpoint.prepare(client, user)()
+    latencies = sorted(endpoint.prepare(client, user)() for _ in range(iterations))
+
+    # The log is cleared when each request starts, so start counting from an empty one
+    send = endpoint.prepare(client, user)
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        send()
+
+    send = endpoint.prepare(client, user)
+    tracemalloc.start()
+    send()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def percentile(percent):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))] * 1000
+
+    return {
+        'p50_ms': round(percentile(50), 2),
+        'p95_ms': round(percentile(95), 2),
+        'p99_ms': round(percentile(99), 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'queries': len(queries),
+        'memory_kib': round(peak / 1024, 1),
+    }
+
+
+def regressions(name, result, baseline, tolerance):
+    if baseline is None:
+        return []
+    found = []
+    if result['queries'] > baseline['queries']:
+        found.append(f'{name}: {result["queries"]} queries, baseline {baseline["queries"]}')
+    for metric in ('p95_ms', 'memory_kib'):
+        if result[metric] > baseline[metric] * tolerance:
+            found.append(f'{name}: {metric} {result[metric]}, baseline {baseline[metric]}')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints against the seeded database.')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file to compare against or save')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Allowed ratio of p95 latency and memory to the baseline')
+    parser.add_argument('--only', nargs='*', help='Names of the endpoints to run')
+    args = parser.parse_args()
+
+    # Lets the test client through ALLOWED_HOSTS
+    setup_test_environment()
+    user = User.objects.select_related('auth_token').filter(username=username(0)).first()
+    if user is None:
+        sys.exit('No benchmark data, run benchmarks/seed.py first')
+
+    baseline = {}
+    if not args.save_baseline:
+        if not os.path.exists(args.baseline):
+            sys.exit(f'No baseline at {args.baseline}, run with --save-baseline first')
+        with open(args.baseline) as file:
+            baseline = json.load(file)['endpoints']
+
+    results = {}
+    failures = []
+    client = Client()
+    print(f'{"endpoint":24} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"memory KiB":>11}')
+    try:
+        with transaction.atomic():
+            for endpoint in endpoints(user):
+                if args.only and endpoint.name not in args.only:
+                    continue
+                try:
+                    result = measure(endpoint, client, user, args.iterations)
+                except RuntimeError as e:
+                    failures.append(str(e))
+                    continue
+                results[endpoint.name] = result
+                failures += regressions(endpoint.name, result, baseline.get(endpoint.name), args.tolerance)
+                print(f'{endpoint.name:24} {result["p50_ms"]:9.2f} {result["p95_ms"]:9.2f} '
+                      f'{result["p99_ms"]:9.2f} {result["queries"]:8} {result["memory_kib"]:11.1f}')
+            raise Rollback
+    except Rollback:
+        pass
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'database': connection.vendor, 'endpoints': results}, file, indent=2)
+        print(f'saved baseline to {args.baseline}')
+
+    if failures:
+        print('\n'.join(['', 'regressions:'] + failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Seeds the configured database with benchmark data, run from the project directory:
+
+    python manage.py migrate
+    python benchmarks/seed.py --users 10000 --workouts 50 --exercises 4 --sets 1000000
+
+Users are named bench-00000, bench-00001, ... and share the password BENCHMARK_PASSWORD.
+The first one is staff, so it can call the admin endpoints, and is the user benchmarks/run.py
+sends requests as. Each user gets the same number of workouts, exercises and sets, with
+sets spread over the last 90 days and the latest few within the last hour. Rows are
+written with bulk inserts, a chunk of users at a time. For a local SQLite database set
+DB_ENGINE=django.db.backends.sqlite3 and DB_NAME to a file name.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from workouts.models import Exercise, Set, Workout
+from workouts.records import rebuild_records
+
+USERNAME_PREFIX = 'bench-'
+BENCHMARK_PASSWORD = 'bench-password'
+BATCH_SIZE = 5000
+
+
+def username(index):
+    return f'{USERNAME_PREFIX}{index:05d}'
+
+
+# Lets rows keep the timestamps they are given instead of the time they are inserted
+@contextlib.contextmanager
+def explicit_timestamps(*fields):
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def seed_users(first, count, password, args, now):
+    users = User.objects.bulk_create([
+        User(username=username(index), password=password, is_staff=index == 0)
+        for index in range(first, first + count)
+    ], batch_size=BATCH_SIZE)
+    Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users],
+                              batch_size=BATCH_SIZE)
+
+    workouts = Workout.objects.bulk_create([
+        Workout(user=user, name=f'Workout {index}', created_at=now, updated_at=now)
+        for user in users for index in range(args.workouts)
+    ], batch_size=BATCH_SIZE)
+    exercises = Exercise.objects.bulk_create([
+        Exercise(user_id=workout.user_id, workout=workout, name=f'Exercise {index}', current_weight=100,
+                 target_sets=3, target_reps=10, weight_modifier=5, updated_at=now)
+        for workout in workouts for index in range(args.exercises)
+    ], batch_size=BATCH_SIZE)
+
+    # Each user's sets cycle through their exercises, oldest first
+    sets_per_user = args.sets // args.users
+    exercises_per_user = args.workouts * args.exercises
+    history = timedelta(days=90)
+    sets = []
+    for offset in range(count):
+        user_exercises = exercises[offset * exercises_per_user:(offset + 1) * exercises_per_user]
+        if not user_exercises:
+            break
+        for index in range(sets_per_user):
+            exercise = user_exercises[index % len(user_exercises)]
+            # The latest sets fall within the last hour, the rest spread over the history
+            remaining = sets_per_user - index
+            if remaining <= exercises_per_user:
+                created_at = now - timedelta(minutes=remaining)
+            else:
+                created_at = now - history * remaining / sets_per_user
+            sets.append(Set(user_id=exercise.user_id, exercise=exercise, weight=100 - index % 3 * 5,
+                            reps=10 - index % 4, created_at=created_at))
+    Set.objects.bulk_create(sets, batch_size=BATCH_SIZE)
+    return len(users), len(workouts), len(exercises), len(sets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database with benchmark data.')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--workouts', type=int, default=50, help='Workouts per user')
+    parser.add_argument('--exercises', type=int, default=4, help='Exercises per workout')
+    parser.add_argument('--sets', type=int, default=1000000, help='Sets in total, split evenly between users')
+    parser.add_argument('--chunk', type=int, default=200, help='Users inserted per transaction')
+    parser.add_argument('--flush', action='store_true', help='Delete existing benchmark users first')
+    args = parser.parse_args()
+
+    existing = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    if args.flush:
+        # Sets and exercises first, so the cascade from users has little left to collect
+        Set.objects.filter(user__in=existing).delete()
+        Exercise.objects.filter(user__in=existing).delete()
+        existing.delete()
+    elif existing.exists():
+        sys.exit('Benchmark users already exist, pass --flush to replace them')
+
+    # All users share one password, hashed once
+    password = make_password(BENCHMARK_PASSWORD)
+    now = timezone.now()
+    started = time.monotonic()
+    totals = [0, 0, 0, 0]
+    with explicit_timestamps(Workout._meta.get_field('created_at'), Workout._meta.get_field('updated_at'),
+                             Exercise._meta.get_field('updated_at'), Set._meta.get_field('created_at')):
+        for first in range(0, args.users, args.chunk):
+            with transaction.atomic():
+                counts = seed_users(first, min(args.chunk, args.users - first), password, args, now)
+            totals = [total + count for total, count in zip(totals, counts)]
+            print(f'\r{totals[0]}/{args.users} users', end='', flush=True)
+    print()
+
+    # Bulk inserts skip the write paths keeping personal records and volume rollups, so build
+    # them from the sets
+    with transaction.atomic():
+        rebuild_records(Set.objects.filter(user__username__startswith=USERNAME_PREFIX), BATCH_SIZE)
+    call_command('reconcile_volume_rollups', chunk=args.chunk)
+
+    print(f'seeded {totals[0]} users, {totals[1]} workouts, {totals[2]} exercises and {totals[3]} sets '
+          f'in {time.monotonic() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Serialization benchmark, run from the project directory:
+
+    python benchmarks/serializers.py --rows 1000 --repeat 50
+
+Serializes and renders a list of sets the way the list endpoints used to (ModelSerializer
+and JSONRenderer) and the way they do now (values() rows and FastJSONRenderer), checks
+that every variant renders the same bytes, and reports the best responses per second
+for each.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django
+
+django.setup()
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from project.renderers import FastJSONRenderer, orjson
+from workouts.models import Set
+from workouts.serializers import SetSerializer, set_values_serializer
+
+
+def make_rows(count):
+    started = timezone.now()
+    return [
+        {'id': i, 'user': 1, 'exercise': i // 10, 'weight': 100 + i % 20, 'reps': 10 - i % 5,
+         'created_at': started + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark list response serialization.')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    instances = [
+        Set(id=row['id'], user_id=row['user'], exercise_id=row['exercise'], weight=row['weight'],
+            reps=row['reps'], created_at=row['created_at'])
+        for row in rows
+    ]
+    variants = {
+        'ModelSerializer + JSONRenderer': lambda: JSONRenderer().render(SetSerializer(instances, many=True).data),
+        'values rows + JSONRenderer': lambda: JSONRenderer().render(set_values_serializer.rows(rows)),
+        'values rows + FastJSONRenderer': lambda: FastJSONRenderer().render(set_values_serializer.rows(rows)),
+    }
+    if orjson is None:
+        print('orjson is not installed, FastJSONRenderer falls back to JSONRenderer')
+
+    outputs = {name: render() for name, render in variants.items()}
+    if len(set(outputs.values())) != 1:
+        sys.exit('Variants rendered different output')
+
+    print(f'{args.rows} rows, {len(next(iter(outputs.values())))} bytes per response')
+    for name, render in variants.items():
+        # The fastest of the repeats is the least disturbed by anything else running
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        print(f'{name:32} {1 / best:8.1f} responses/s  {best * 1000:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for serving the project in production.
+
+Gunicorn loads this file from the working directory, so the container only runs
+``gunicorn``. Every setting can be overridden from the environment. Send the master
+process SIGHUP to reload the code and settings gracefully: new workers are started
+before the old ones finish their in-flight requests and exit.
+
+For more information on this file, see
+https://docs.gunicorn.org/en/stable/settings.html
+"""
+
+import multiprocessing
+import os
+import shutil
+
+# Serve the WSGI application with threaded workers. Set GUNICORN_APP=project.asgi:application
+# and GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker to serve the ASGI application instead,
+# where the authentication views run on the event loop, and every other view costs a thread
+# hop. Compare the two with benchmarks/loadtest.py --pid.
+wsgi_app = os.environ.get('GUNICORN_APP', 'project.wsgi:application')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# One process per worker, defaulting to the usual (2 x CPU cores) + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Threads per worker, used by the gthread worker class
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Keep client connections open between requests, e.g. behind a load balancer
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Seconds a worker may spend on a request, and to finish in-flight requests on shutdown or reload
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then, so slow leaks cannot build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = '-'
+
+# Workers write their Prometheus metrics to files in this directory, which /metrics/ adds up.
+# Files of earlier runs would be added up too, so the directory is emptied on startup.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+# Gauges of exited workers no longer count towards live totals
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
+# Persistent connections are tied to the thread that opened them, and under ASGI requests
+# do not reuse threads, so rely on DB_POOL=1 instead
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
 application = get_asgi_application()
@@ -0,0 +1,10 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Caches other processes cannot read. What one process stores in them, or deletes from them,
+# is invisible to every other process, e.g. each gunicorn worker.
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+def is_process_local(cache):
+    return isinstance(cache, PROCESS_LOCAL_CACHES)
@@ -0,0 +1,67 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+
+# Start of the oldest transaction that has written to a Postgres database, other than this
+# connection's. Only transactions holding a transaction id have written anything, so
+# read-only ones, like pg_dump's, are left out.
+OLDEST_TRANSACTION_SQL = '''
+    SELECT min(xact_start) FROM pg_stat_activity
+    WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+        AND backend_xid IS NOT NULL
+'''
+
+
+# Usage of the connection pool of every database, or None for databases without one
+def pool_stats():
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            stats[alias] = None
+            continue
+
+        counters = pool.get_stats()
+        stats[alias] = {
+            'size': counters.get('pool_size', 0),
+            'max_size': counters.get('pool_max', 0),
+            'in_use': counters.get('pool_size', 0) - counters.get('pool_available', 0),
+            'available': counters.get('pool_available', 0),
+            'waiting': counters.get('requests_waiting', 0),
+            # Totals since the pool was opened
+            'requests': counters.get('requests_num', 0),
+            'requests_queued': counters.get('requests_queued', 0),
+            'wait_ms': counters.get('requests_wait_ms', 0),
+            'errors': counters.get('requests_errors', 0) + counters.get('requests_timeouts', 0),
+        }
+    return stats
+
+
+# Runs every query of every database, in any thread, through the given execute wrapper.
+# connection.execute_wrapper() only covers the connections of the current thread, while the
+# async ORM runs queries in worker threads with connections of their own, so the wrapper is
+# added to each connection as it is created. It goes first, leaving the wrappers entered with
+# connection.execute_wrapper() last, where they expect to be popped from.
+def install_execute_wrapper(wrapper):
+    def install(connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, wrapper)
+
+    for connection in connections.all():
+        install(connection)
+    connection_created.connect(install, weak=False, dispatch_uid=id(wrapper))
+
+
+# Start of the oldest writing transaction still open on the database, whose writes become
+# visible only when it commits, however long before that they were made. None when no other
+# transaction has written, and on databases other than Postgres, which do not report it.
+# Readers that must not miss those writes wait for it, so a long writing transaction, like
+# rebuild_personal_records or reconcile_volume_rollups, holds them back to its start until
+# it ends.
+def oldest_transaction_start(alias=DEFAULT_DB_ALIAS):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(OLDEST_TRANSACTION_SQL)
+        return cursor.fetchone()[0]
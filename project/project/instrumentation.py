@@ -0,0 +1,159 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .db import install_execute_wrapper
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the instrumented request being handled, None when it is not instrumented
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+# Lists of placeholders, e.g. from __in lookups, have the same shape whatever their length
+PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_query = (0.0, None)
+        self.query_shapes = Counter()
+        # Seconds spent in each timed section, e.g. auth and serialize
+        self.sections = Counter()
+        # Sections being timed, so sections timed again within themselves count once
+        self.active_sections = set()
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.db_time += duration
+        if duration > self.slowest_query[0]:
+            self.slowest_query = (duration, sql)
+        self.query_shapes[PLACEHOLDER_LIST.sub('%s, ...', sql)] += 1
+
+    def repeated_queries(self, threshold):
+        return {sql: count for sql, count in self.query_shapes.items() if count >= threshold}
+
+    def server_timing(self):
+        timings = [f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"']
+        timings += [f'{name};dur={duration * 1000:.1f}' for name, duration in self.sections.items()]
+        timings.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(timings)
+
+
+# Adds the time spent in the block to the named section of the instrumented request, if any.
+# Blocks nested in a block of the same section are part of its time.
+@contextlib.contextmanager
+def timed(section):
+    metrics = current_metrics.get()
+    if metrics is None or section in metrics.active_sections:
+        yield
+        return
+    metrics.active_sections.add(section)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.sections[section] += time.perf_counter() - started
+        metrics.active_sections.discard(section)
+
+
+# Decorator form of timed, for methods
+def timed_method(section):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with timed(section):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Records the queries of the instrumented request, in whichever thread the ORM runs them
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+# Records the queries and timings of a sample of requests. Sampled requests get a Server-Timing
+# header, a structured log line, and a warning for any query repeated often enough to be an N+1.
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_execute_wrapper(record_query)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        config = settings.INSTRUMENTATION
+        if random.random() >= config['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(request, response, metrics, config)
+
+    async def __acall__(self, request):
+        config = settings.INSTRUMENTATION
+        if random.random() >= config['SAMPLE_RATE']:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(request, response, metrics, config)
+
+    def report(self, request, response, metrics, config):
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing()
+        self.log(request, response, metrics, config)
+        return response
+
+    def log(self, request, response, metrics, config):
+        match = request.resolver_match
+        view = match.view_name if match else None
+        slowest_duration, slowest_sql = metrics.slowest_query
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - metrics.started) * 1000, 2),
+            'query_count': metrics.query_count,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'slowest_query_ms': round(slowest_duration * 1000, 2),
+            'slowest_query': slowest_sql,
+            **{f'{name}_ms': round(duration * 1000, 2) for name, duration in metrics.sections.items()},
+        }))
+
+        for sql, count in metrics.repeated_queries(config['N_PLUS_ONE_THRESHOLD']).items():
+            logger.warning(json.dumps({'n_plus_one': sql, 'count': count, 'view': view, 'path': request.path}))
@@ -0,0 +1,129 @@
+import contextvars
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from .db import install_execute_wrapper, pool_stats
+
+# With PROMETHEUS_MULTIPROC_DIR set, e.g. by gunicorn.conf.py, every worker process writes its
+# values to memory mapped files in that directory, and /metrics adds up the files of all workers.
+# The directory must be emptied before the server starts.
+# https://prometheus.github.io/client_python/multiprocess/
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name', ['view', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('http_requests', 'Responses by URL name and status', ['view', 'method', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress', 'Requests being handled', multiprocess_mode='livesum')
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request by URL name', ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups by cache and result', ['cache', 'result'])
+DB_POOL = Gauge('db_pool', 'Connection pool usage by database, see project/db.py', ['database', 'stat'],
+                multiprocess_mode='livesum')
+DB_REPLICA_LAG = Gauge('db_replica_lag_seconds', 'Replication lag by replica, see project/routers.py',
+                       ['database'], multiprocess_mode='livemax')
+
+
+def count_cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+# The query count of the request being handled, None outside of requests
+current_query_count = contextvars.ContextVar('current_query_count', default=None)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+# Counts the queries of the request being handled, in whichever thread the ORM runs them
+def count_query(execute, sql, params, many, context):
+    queries = current_query_count.get()
+    if queries is not None:
+        queries.count += 1
+    return execute(sql, params, many, context)
+
+
+# Records the latency, status and query count of every request, labelled by the name of the
+# URL it resolved to rather than its path, so ids in the path do not multiply the series
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pool_stats_updated = 0
+        install_execute_wrapper(count_query)
+        # Under ASGI the middleware stays on the event loop, so async views do too
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started, queries, token = self.request_started()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.request_finished(token)
+        return self.record(request, response, started, queries)
+
+    async def __acall__(self, request):
+        started, queries, token = self.request_started()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.request_finished(token)
+        return self.record(request, response, started, queries)
+
+    def request_started(self):
+        REQUESTS_IN_PROGRESS.inc()
+        queries = QueryCounter()
+        return time.perf_counter(), queries, current_query_count.set(queries)
+
+    def request_finished(self, token):
+        current_query_count.reset(token)
+        REQUESTS_IN_PROGRESS.dec()
+
+    def record(self, request, response, started, queries):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUEST_LATENCY.labels(view, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_QUERIES.labels(view).observe(queries.count)
+
+        # Connection pools are per process, so each process publishes its own now and then
+        if started - self.pool_stats_updated > settings.METRICS['POOL_STATS_INTERVAL']:
+            self.pool_stats_updated = started
+            self.update_pool_stats()
+        return response
+
+    def update_pool_stats(self):
+        for alias, stats in pool_stats().items():
+            for stat, value in (stats or {}).items():
+                DB_POOL.labels(alias, stat).set(value)
+
+
+# Prometheus exposition of the metrics of every worker process
+def metrics_view(request):
+    token = settings.METRICS['TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
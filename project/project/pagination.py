@@ -0,0 +1,93 @@
+import datetime
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+# Keyset pagination for the admin list endpoints, newest rows first. The cursor holds the
+# ordering values of the row a page starts after, and each page filters on all of them, so
+# it costs the same however deep into the table it is, and rows sharing a timestamp, like
+# those of one bulk_create(), are paged through by id rather than by offset. Every ordering
+# field must be descending, and the last one unique.
+class CreatedAtCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+
+        # Previous pages are read in ascending order from their cursor, then flipped
+        if position is not None:
+            queryset = queryset.filter(self.after(position, '__gt' if self.reverse else '__lt'))
+        ordering = self.fields if self.reverse else self.ordering
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        # A page reached from a cursor has rows on the side it came from
+        self.has_next = position is not None if self.reverse else more
+        self.has_previous = more if self.reverse else position is not None
+        return self.page
+
+    # Rows past the position in the given direction, i.e. (a, b) < (x, y) written out as
+    # a < x OR (a = x AND b < y), which uses the index on the ordering fields
+    def after(self, position, lookup):
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = dict(zip(self.fields[:index], position[:index]))
+            condition |= Q(**equal, **{field + lookup: position[index]})
+        return condition
+
+    def position(self, row):
+        return [getattr(row, field) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.link(self.position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.link(self.position(self.page[0]), reverse=True)
+
+    def link(self, position, reverse):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def encode_cursor(self, position, reverse):
+        values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in position]
+        return signing.dumps({'position': values, 'reverse': reverse}, salt='project.pagination')
+
+    # The position and direction of the requested page, (None, False) for the first one
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None, False
+        try:
+            cursor = signing.loads(cursor, salt='project.pagination')
+            values = cursor['position']
+            if len(values) != len(self.fields):
+                raise ValueError('Cursor does not match the ordering')
+            position = [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+            return position, bool(cursor['reverse'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+# Keyset pagination for tables without a creation timestamp
+class IdCursorPagination(CreatedAtCursorPagination):
+    ordering = ('-id',)
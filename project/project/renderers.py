@@ -0,0 +1,45 @@
+import re
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .instrumentation import timed_method
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Floats the json module writes with an exponent: 1e16 and above, which orjson writes as 1e16
+# rather than 1e+16, and below 1e-4, which orjson writes as 0.00001 rather than 1e-05
+EXPONENT = re.compile(rb'\de[-\d]|(?<![\d.])0\.0000')
+
+# Renders the same bytes as JSONRenderer, using orjson when it is installed. Indented
+# output and anything orjson cannot encode fall back to JSONRenderer. Both write floats
+# with the shortest digits that read back the same, but not with the same exponents, so
+# output holding a float that needs one is rendered again by JSONRenderer. orjson also
+# writes NaN and infinities as null, where JSONRenderer rejects them. The only floats the
+# API returns are personal record values, computed from integer weights and reps, which
+# are always finite.
+class FastJSONRenderer(JSONRenderer):
+    # Types orjson would format differently from the DRF encoder are handed to it instead
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+    @timed_method('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Such a float, or a string that happens to look like one
+        if EXPONENT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # JSONRenderer escapes these two line terminators, which are valid JSON but not valid JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,192 @@
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .caches import is_process_local
+from .metrics import DB_REPLICA_LAG
+
+logger = logging.getLogger(__name__)
+
+# Methods whose requests only read, and may read from a replica
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# How far behind the primary a Postgres replica is. A replica that has replayed everything
+# it received is caught up, however long ago the last transaction was.
+POSTGRES_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+# Where the reads of the request being handled go. Reads go to the primary until the user is
+# authenticated, so tokens are always looked up on the primary, and for the whole of requests
+# that write.
+class RequestRouting:
+    def __init__(self, safe):
+        self.safe = safe
+        self.user_id = None
+        # Alias of the replica the request reads from, None for the primary
+        self.replica = None
+
+
+current_routing = contextvars.ContextVar('current_routing', default=None)
+
+
+def get_cache():
+    return caches[settings.READ_REPLICAS['CACHE']]
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+# Seconds each replica is behind the primary, None for replicas that cannot be reached. Each
+# process checks its replicas every LAG_CHECK_INTERVAL seconds, in whichever request comes first.
+# measured_at is the wall clock time of the last check, comparable with the time of writes.
+class ReplicaLags:
+    def __init__(self):
+        self.lags = {}
+        self.checked_at = -math.inf
+        self.measured_at = -math.inf
+        self._lock = threading.Lock()
+
+    def stale(self):
+        return time.monotonic() - self.checked_at > settings.READ_REPLICAS['LAG_CHECK_INTERVAL']
+
+    def refresh(self):
+        # Requests arriving during a check route by the previous lags
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            measured_at = time.time()
+            self.lags = {alias: replica_lag(alias) for alias in settings.READ_REPLICAS['ALIASES']}
+            self.checked_at, self.measured_at = time.monotonic(), measured_at
+        finally:
+            self._lock.release()
+        for alias, lag in self.lags.items():
+            DB_REPLICA_LAG.labels(alias).set(math.inf if lag is None else lag)
+
+
+def replica_lag(alias):
+    connection = connections[alias]
+    # Only Postgres reports replication lag, other replicas are taken to lag as far as allowed,
+    # so users read their own writes from the primary for that long
+    if connection.vendor != 'postgresql':
+        return settings.READ_REPLICAS['MAX_LAG_SECONDS']
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable', alias, exc_info=True)
+        return None
+
+
+replica_lags = ReplicaLags()
+
+
+# A replica that has caught up with the user's last write, if they wrote recently, and lags
+# no more than MAX_LAG_SECONDS behind the primary. None when no replica qualifies. A replica
+# lagging L seconds when its lag was measured had replayed what was committed L seconds
+# before, so it has the write only if that was measured more than L seconds after the write.
+# Lags measured before the write say nothing about it, and keep the user on the primary.
+def choose_replica(last_write):
+    since_write = replica_lags.measured_at - last_write if last_write is not None else math.inf
+    replicas = [
+        alias for alias, lag in replica_lags.lags.items()
+        if lag is not None and lag <= settings.READ_REPLICAS['MAX_LAG_SECONDS'] and lag < since_write
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+# Called once the request's user is known, to route the reads of safe requests to a replica
+def route_reads(user_id):
+    routing = current_routing.get()
+    if routing is None:
+        return
+    routing.user_id = user_id
+    if routing.safe:
+        if replica_lags.stale():
+            replica_lags.refresh()
+        routing.replica = choose_replica(get_cache().get(pin_key(user_id)))
+
+
+# Sends the remaining reads of the request to the primary, for views that must not read
+# anything older than what was committed when they started
+def read_from_primary():
+    routing = current_routing.get()
+    if routing is not None:
+        routing.replica = None
+
+
+# Sends the reads of safe requests to a replica chosen by route_reads(), and everything else
+# to the primary. Replicas hold the same data, so relations between them are allowed, and
+# only the primary is migrated.
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        return routing.replica if routing is not None else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# Tracks the routing of each request, and after a user writes, pins their reads to the primary
+# until a replica has caught up with the write, for at most STICKY_SECONDS. Pins are kept in
+# the shared cache, so they hold whichever process serves the user's next request.
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.READ_REPLICAS['ALIASES']:
+            raise MiddlewareNotUsed
+        if is_process_local(get_cache()):
+            raise ImproperlyConfigured(
+                f"READ_REPLICAS['CACHE'] ({settings.READ_REPLICAS['CACHE']!r}) must be shared by every process, "
+                'e.g. set REDIS_URL, so users read their own writes whichever process serves them')
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        routing = RequestRouting(request.method in SAFE_METHODS)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if not routing.safe and routing.user_id is not None:
+            get_cache().set(pin_key(routing.user_id), time.time(), settings.READ_REPLICAS['STICKY_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        routing = RequestRouting(request.method in SAFE_METHODS)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if not routing.safe and routing.user_id is not None:
+            await get_cache().aset(pin_key(routing.user_id), time.time(), settings.READ_REPLICAS['STICKY_SECONDS'])
+        return response
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+
+from .instrumentation import timed
+
+
+# Times the validation and output of a serializer as the 'serialize' section of instrumented
+# requests. Lists of serializers time each item, and nested serializers are part of their
+# parent's time.
+class TimedSerializerMixin:
+    def run_validation(self, *args, **kwargs):
+        with timed('serialize'):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        with timed('serialize'):
+            return super().to_representation(*args, **kwargs)
+
+
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -20,12 +22,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-cu_b502b-#w8*+u12tir*9bspcfmy*3s73ks=lb)ulpl=1a8$9'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY', 'django-insecure-cu_b502b-#w8*+u12tir*9bspcfmy*3s73ks=lb)ulpl=1a8$9')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Debug mode also records every SQL query in memory, so production sets DJANGO_DEBUG=0
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
 
 
 # Application definition
@@ -47,11 +51,18 @@ INSTALLED_APPS = [
 # Rest Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # Enable TokenAuthentication
+        'authentication.authentication.CachedTokenAuthentication',  # Enable cached TokenAuthentication
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'project.renderers.FastJSONRenderer',  # JSONRenderer output, rendered by orjson when installed
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
 MIDDLEWARE = [
+    'project.metrics.MetricsMiddleware',  # Request metrics served at /metrics/, see METRICS
+    'project.instrumentation.InstrumentationMiddleware',  # Times a sample of requests, see INSTRUMENTATION
+    'project.routers.ReplicaRoutingMiddleware',  # Routes reads to replicas, see READ_REPLICAS
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,15 +101,160 @@ WSGI_APPLICATION = 'project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'mydb',
-        'USER': 'myuser',
-        'PASSWORD': 'mypassword',
-        'HOST': 'postgres_db',  # This is the service name defined in docker-compose.yml
-        'PORT': 5432,
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'mydb'),
+        'USER': os.environ.get('DB_USER', 'myuser'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'mypassword'),
+        'HOST': os.environ.get('DB_HOST', 'postgres_db'),  # This is the service name defined in docker-compose.yml
+        'PORT': int(os.environ.get('DB_PORT', 5432)),
+        # Keep connections open between requests for this many seconds, checking they still
+        # work before reusing them. Under ASGI this defaults to 0, see project/asgi.py.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# SQLite takes one writer at a time. Transactions take the write lock when they start, so
+# concurrent writers wait for each other instead of failing to upgrade their locks. The test
+# database is a file in the temp directory rather than in memory, so test threads can write
+# through connections of their own.
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), 'test_db.sqlite3')}
+
+# Optional connection pool shared by the threads of each process, needs psycopg 3 with
+# psycopg_pool. Pooled connections replace persistent ones, so CONN_MAX_AGE must be 0.
+# https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+if os.environ.get('DB_POOL') == '1':
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            # Connections kept open, and how many more may be opened under load
+            'min_size': DB_POOL_SIZE,
+            'max_size': DB_POOL_SIZE + int(os.environ.get('DB_POOL_MAX_OVERFLOW', 4)),
+            # Seconds a request waits for a connection before failing
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # Seconds before connections above min_size are closed when idle
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        }
+    }
+
+# Read replicas of the default database, e.g. DB_REPLICAS=replica-1,replica-2 for their hosts,
+# or with SQLite, names of files holding copies of the default database. They are named
+# replica1, replica2, ... and share the default database's other settings.
+DB_REPLICAS = [replica for replica in os.environ.get('DB_REPLICAS', '').split(',') if replica]
+for index, replica in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST': replica,
+        # Tests read the test database through the replicas
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['project.routers.ReplicaRouter']
+
+# Routing of reads to the replicas, see project/routers.py
+READ_REPLICAS = {
+    'ALIASES': [f'replica{index}' for index in range(1, len(DB_REPLICAS) + 1)],
+    # After writing, a user reads from the primary until a replica has caught up with the
+    # write, for at most this many seconds. Keep it above MAX_LAG_SECONDS.
+    'STICKY_SECONDS': int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 30)),
+    # Replicas lagging further behind the primary are not read from
+    'MAX_LAG_SECONDS': float(os.environ.get('DB_REPLICA_MAX_LAG', 5)),
+    # Seconds between checks of the replicas' lag by each process
+    'LAG_CHECK_INTERVAL': 2,
+    # Cache alias shared by every process, holding the users' last writes. The middleware
+    # refuses process-local caches, so with replicas the default cache needs REDIS_URL.
+    'CACHE': 'default',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Share the cache between processes when a Redis server is available
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Token authentication cache, in front of the authtoken_token table
+TOKEN_AUTH_CACHE = {
+    # Cache alias shared by every process. Tokens are looked up in the database on every
+    # request when it is process-local, as the default cache is without REDIS_URL.
+    'CACHE': 'default',
+    'TIMEOUT': 300,  # Seconds a token is kept in the shared cache
+    # Seconds a token is kept in each process, 0 to disable. Deleting a token or its user only
+    # clears the process handling the deletion, so other processes accept the token until it
+    # expires from theirs.
+    'LOCAL_TTL': 0,
+    'LOCAL_MAXSIZE': 1024,  # Number of tokens kept in each process
+}
+
+
+# Password hashing done by the login and registration views
+PASSWORD_HASHING = {
+    'MAX_WORKERS': 4,  # Passwords hashed at the same time by each process
+    'MAX_PENDING': 32,  # Passwords waiting for a worker before logins are rejected with a 429
+    'REMEMBER_TIMEOUT': 86400,  # Seconds a returning user can log in without hashing again
+}
+
+
+# Per-request SQL and timing instrumentation, see project/instrumentation.py
+INSTRUMENTATION = {
+    # Fraction of requests instrumented, 0 turns instrumentation off
+    'SAMPLE_RATE': float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 0)),
+    # Send the timings of instrumented requests to clients in a Server-Timing header
+    'SERVER_TIMING': os.environ.get('INSTRUMENTATION_SERVER_TIMING', '1') == '1',
+    # Identical queries repeated this many times in one request are logged as a likely N+1
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+
+
+# Prometheus metrics, see project/metrics.py
+METRICS = {
+    # Bearer token scrapers must send to /metrics/, which is open without one
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    # Seconds between updates of each process's connection pool gauges
+    'POOL_STATS_INTERVAL': 5,
+}
+
+
+# Workouts
+
+# Cache alias and lifetime in seconds of the responses of the read views, cached per user.
+# Responses are not cached when the cache is process-local, as the default one is without
+# REDIS_URL.
+WORKOUTS_CACHE = 'default'
+WORKOUTS_CACHE_TIMEOUT = 3600
+
+# Largest list of sets accepted by a single request
+WORKOUTS_MAX_SETS_PER_REQUEST = 1000
+
+# Number of sets written by each INSERT when a list of sets is created
+WORKOUTS_SETS_BATCH_SIZE = 250
+
+# Number of rows fetched from the database at a time when exporting a user's sets
+WORKOUTS_EXPORT_CHUNK_SIZE = 2000
+
+# Days deletions are kept for delta sync. Clients with an older cursor resync from scratch.
+WORKOUTS_SYNC_TOMBSTONE_DAYS = 30
+
+# Seconds each sync reads back before its sync point, to catch writes committed late. On
+# Postgres the point already waits for open transactions, see workouts.views.sync_point().
+WORKOUTS_SYNC_OVERLAP_SECONDS = 5
+
+# Rows of each kind returned by one sync request. Larger syncs come in pages.
+WORKOUTS_SYNC_PAGE_SIZE = 500
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -0,0 +1,365 @@
+import json
+import math
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from authentication.authentication import local_tokens
+from authentication.views import UserListView
+from workouts.models import Workout
+
+from .db import oldest_transaction_start, pool_stats
+from .instrumentation import RequestMetrics
+from .metrics import REGISTRY
+from .renderers import FastJSONRenderer, orjson
+from .routers import ReplicaRouter, ReplicaRoutingMiddleware, RequestRouting, current_routing, pin_key, replica_lags, route_reads
+
+
+# Caches other processes can and cannot read, see project/caches.py
+PROCESS_LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': f'{tempfile.gettempdir()}/shared-test-cache',
+}}
+
+
+class DatabasePoolStatsViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_admin_only(self):
+        response = self.client.get(reverse('db-pool-stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_success(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get(reverse('db-pool-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('default', response.data)
+
+    def test_pool_stats(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_min': 4, 'pool_max': 8, 'pool_size': 6, 'pool_available': 2,
+            'requests_waiting': 1, 'requests_num': 100, 'requests_queued': 10,
+            'requests_wait_ms': 250, 'requests_errors': 1, 'requests_timeouts': 2,
+        }
+        with mock.patch.object(type(connections['default']), 'pool', pool, create=True):
+            stats = pool_stats()
+
+        self.assertEqual(stats['default'], {
+            'size': 6, 'max_size': 8, 'in_use': 4, 'available': 2, 'waiting': 1,
+            'requests': 100, 'requests_queued': 10, 'wait_ms': 250, 'errors': 3,
+        })
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Only Postgres reports open transactions')
+class OldestTransactionTest(TransactionTestCase):
+    # Test that only transactions that have written hold the sync point back. Statistics are
+    # read once per transaction, so this runs outside of one.
+    def test_writing_transactions(self):
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            other.set_autocommit(False)
+            with other.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                self.assertIsNone(oldest_transaction_start())
+                cursor.execute('SELECT pg_current_xact_id()')
+                self.assertIsNotNone(oldest_transaction_start())
+            other.rollback()
+        finally:
+            other.close()
+
+
+@skipIf(orjson is None, 'orjson is not installed')
+class FastJSONRendererTest(SimpleTestCase):
+    # Test that the output matches JSONRenderer byte for byte
+    def test_matches_json_renderer(self):
+        data = [{
+            'id': 2 ** 40, 'name': 'Bench press \u00e9\u2028\u2029\x00"\\', 'weight': None, 'done': True,
+            'created_at': datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=dt_timezone.utc), 'day': date(2024, 1, 2),
+            'ratio': Decimal('1.5'), 'sets': [], 'tags': {'a': 1},
+        }]
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    # Test that values orjson cannot encode fall back to JSONRenderer
+    def test_fallback(self):
+        data = {'id': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    # Test that floats, with and without exponents, are written the same way
+    def test_floats(self):
+        for value in (116.66666666666667, 0.1, 1e-05, 1.5e-07, 1e16, 1.7976931348623157e308, -2.5e22):
+            with self.subTest(value=value):
+                data = {'value': value, 'name': 'e1'}
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    # Test that NaN is written as null rather than rejected as JSONRenderer does
+    def test_nan(self):
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'value': float('nan')})
+        self.assertEqual(FastJSONRenderer().render({'value': float('nan')}), b'{"value":null}')
+
+    def test_indent(self):
+        data = {'id': 1}
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class InstrumentationMiddlewareTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def instrumentation(self, **config):
+        return override_settings(INSTRUMENTATION={
+            'SAMPLE_RATE': 1, 'SERVER_TIMING': True, 'N_PLUS_ONE_THRESHOLD': 5, **config})
+
+    # Test that instrumented requests report their timings and log them
+    def test_instrumented(self):
+        with self.instrumentation(), self.assertLogs('project.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('get-my-workouts'))
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", auth;dur=[\d.]+, ')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'get-my-workouts')
+        self.assertGreater(record['query_count'], 0)
+        self.assertIsNotNone(record['slowest_query'])
+
+    # Test that views validating and serializing with model serializers report that time too
+    def test_model_serializers(self):
+        data = {'name': 'test workout', 'exercises': [
+            {'name': 'test exercise', 'current_weight': 100, 'target_sets': 3, 'target_reps': 10, 'weight_modifier': 5},
+        ]}
+        with self.instrumentation(), self.assertLogs('project.instrumentation', 'INFO'):
+            response = self.client.post(reverse('create-workout'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Server-Timing'].count('serialize;dur='), 1)
+
+    # Test that queries run in worker threads under ASGI are recorded too
+    async def test_instrumented_async(self):
+        with self.instrumentation(), self.assertLogs('project.instrumentation', 'INFO') as logs:
+            response = await self.async_client.get(reverse('get-my-workouts'),
+                                                   headers={'Authorization': 'Token ' + self.token.key})
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries", auth;dur=[\d.]+, ')
+        self.assertGreater(json.loads(logs.records[0].getMessage())['query_count'], 0)
+
+    def test_not_sampled(self):
+        with self.instrumentation(SAMPLE_RATE=0):
+            response = self.client.get(reverse('get-my-workouts'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_server_timing_off(self):
+        with self.instrumentation(SERVER_TIMING=False), self.assertLogs('project.instrumentation', 'INFO'):
+            response = self.client.get(reverse('get-my-workouts'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    # Test that the same query repeated for every row is reported
+    def test_n_plus_one(self):
+        for i in range(5):
+            User.objects.create_user(username=f'user{i}')
+
+        # Without its prefetch, the user list looks up the groups of each user one by one
+        with self.instrumentation(), self.assertLogs('project.instrumentation', 'WARNING') as logs, \
+                mock.patch.object(UserListView, 'queryset', User.objects.all()):
+            self.client.get(reverse('list-users'))
+
+        warning = json.loads(logs.records[0].getMessage())
+        self.assertEqual(warning['view'], 'list-users')
+        self.assertGreaterEqual(warning['count'], 5)
+
+    # Test that IN lists of different lengths count as the same query
+    def test_query_shape(self):
+        metrics = RequestMetrics()
+        metrics.record_query('SELECT * FROM t WHERE id IN (%s, %s)', 0.001)
+        metrics.record_query('SELECT * FROM t WHERE id IN (%s, %s, %s)', 0.002)
+        self.assertEqual(metrics.repeated_queries(2), {'SELECT * FROM t WHERE id IN (%s, ...)': 2})
+        self.assertEqual(metrics.slowest_query, (0.002, 'SELECT * FROM t WHERE id IN (%s, %s, %s)'))
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class MetricsViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    # Test that requests are counted by URL name rather than path
+    def test_request_metrics(self):
+        labels = {'view': 'get-workout-exercises', 'method': 'GET'}
+        requests = self.sample('http_requests_total', status='404', **labels)
+        latencies = self.sample('http_request_duration_seconds_count', **labels)
+        queries = self.sample('http_request_db_queries_sum', view='get-workout-exercises')
+
+        self.client.get(reverse('get-workout-exercises', kwargs={'workout_id': 1}))
+        self.client.get(reverse('get-workout-exercises', kwargs={'workout_id': 2}))
+
+        self.assertEqual(self.sample('http_requests_total', status='404', **labels), requests + 2)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), latencies + 2)
+        self.assertGreater(self.sample('http_request_db_queries_sum', view='get-workout-exercises'), queries)
+
+    async def test_request_metrics_async(self):
+        queries = self.sample('http_request_db_queries_sum', view='get-my-workouts')
+        response = await self.async_client.get(reverse('get-my-workouts'),
+                                               headers={'Authorization': 'Token ' + self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(self.sample('http_request_db_queries_sum', view='get-my-workouts'), queries)
+
+    def test_cache_metrics(self):
+        hits = self.sample('cache_requests_total', cache='workouts_responses', result='hit')
+        misses = self.sample('cache_requests_total', cache='workouts_responses', result='miss')
+
+        self.client.get(reverse('get-my-workouts'))
+        self.client.get(reverse('get-my-workouts'))
+
+        self.assertEqual(self.sample('cache_requests_total', cache='workouts_responses', result='miss'), misses + 1)
+        self.assertEqual(self.sample('cache_requests_total', cache='workouts_responses', result='hit'), hits + 1)
+
+    def test_exposition(self):
+        self.client.get(reverse('get-my-workouts'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'http_requests_total{method="GET",status="200",view="get-my-workouts"}', response.content)
+
+    @override_settings(METRICS={'TOKEN': 'secret', 'POOL_STATS_INTERVAL': 5})
+    def test_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+REPLICAS = {'ALIASES': ['replica1', 'replica2'], 'STICKY_SECONDS': 30, 'MAX_LAG_SECONDS': 5,
+            'LAG_CHECK_INTERVAL': 2, 'CACHE': 'default'}
+
+
+@override_settings(READ_REPLICAS=REPLICAS, CACHES=SHARED_CACHES)
+class ReplicaRouterTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    # Routes the reads of a request made with the given lags, measured the given number of
+    # seconds ago, returning the chosen replica
+    def route(self, lags, safe=True, age=0):
+        routing = RequestRouting(safe)
+        token = current_routing.set(routing)
+        try:
+            with mock.patch.object(replica_lags, 'lags', lags), \
+                    mock.patch.object(replica_lags, 'checked_at', time.monotonic()), \
+                    mock.patch.object(replica_lags, 'measured_at', time.time() - age):
+                route_reads(self.user.id)
+                self.assertEqual(Workout.objects.all().db, routing.replica or 'default')
+        finally:
+            current_routing.reset(token)
+        return routing.replica
+
+    def test_safe_requests(self):
+        self.assertEqual(self.route({'replica1': 0.5, 'replica2': None}), 'replica1')
+        self.assertIsNone(self.route({'replica1': 0.5}, safe=False))
+        self.assertEqual(ReplicaRouter().db_for_write(Workout), 'default')
+
+        # Outside of requests everything goes to the primary
+        self.assertIsNone(ReplicaRouter().db_for_read(Workout))
+
+    # Test that replicas lagging too far behind the primary are not read from
+    def test_lag(self):
+        self.assertIsNone(self.route({'replica1': 6, 'replica2': None}))
+        self.assertEqual(self.route({'replica1': 6, 'replica2': 4.5}), 'replica2')
+
+    # Test that a user reads from the primary until a replica has caught up with their write
+    def test_read_your_writes(self):
+        cache.set(pin_key(self.user.id), time.time() - 2)
+        self.assertIsNone(self.route({'replica1': 3}))
+        self.assertEqual(self.route({'replica1': 1}), 'replica1')
+
+    # Test that lags measured before the user's last write do not route them to a replica
+    def test_lag_before_write(self):
+        cache.set(pin_key(self.user.id), time.time() - 0.01)
+        self.assertIsNone(self.route({'replica1': 0}, age=1.9))
+        self.assertEqual(self.route({'replica1': 0}), 'replica1')
+
+    # Test that requests writing pin their user, and never read from a replica
+    def test_pin_after_write(self):
+        with mock.patch.object(replica_lags, 'lags', {}), \
+                mock.patch.object(replica_lags, 'checked_at', time.monotonic()):
+            response = self.client.post(reverse('create-workout'), {
+                'name': 'workout', 'exercises': [{'name': 'squat', 'current_weight': 100, 'target_sets': 3,
+                                                  'target_reps': 5, 'weight_modifier': 5}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertAlmostEqual(cache.get(pin_key(self.user.id)), time.time(), delta=5)
+
+    # Test that pins are not kept in caches other processes cannot read
+    def test_process_local_cache(self):
+        with override_settings(CACHES=PROCESS_LOCAL_CACHES):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaRoutingMiddleware(lambda request: None)
+        ReplicaRoutingMiddleware(lambda request: None)
+
+
+# Runs alone with replicas configured, where the test database is read through each replica
+# alias as well, e.g. with SQLite:
+#   DB_REPLICAS=replica.sqlite3 python manage.py test project.tests.ReplicaRoutingTest
+# Other test cases keep their data in uncommitted transactions no replica can see.
+@skipUnless(settings.READ_REPLICAS['ALIASES'], 'Needs DB_REPLICAS')
+@override_settings(CACHES=SHARED_CACHES)
+class ReplicaRoutingTest(APITransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        Workout.objects.create(user=self.user, name='workout')
+
+    def test_reads_from_replica(self):
+        replica_lags.checked_at = -math.inf
+        with ExitStack() as stack:
+            replica_queries = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                               for alias in settings.READ_REPLICAS['ALIASES']]
+            primary_queries = stack.enter_context(CaptureQueriesContext(connection))
+            response = self.client.get(reverse('get-my-workouts'))
+
+        self.assertEqual(len(response.data), 1)
+        # The token is looked up on the primary, the workouts read from a replica
+        self.assertIn('authtoken_token', ' '.join(query['sql'] for query in primary_queries))
+        self.assertIn('workouts_workout', ' '.join(query['sql'] for queries in replica_queries
+                                                    for query in queries))
+
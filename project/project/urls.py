@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import metrics_view
+from .views import DatabasePoolStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('authentication.urls')),
     path('workouts/', include('workouts.urls')),
+    path('db-pool/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
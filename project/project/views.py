@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .db import pool_stats
+
+
+# APIView whose handlers may be coroutines. Under ASGI the request stays on the event loop,
+# and only sync handlers and authentication are run in a worker thread.
+class AsyncAPIView(APIView):
+    # Sync and async handlers may be mixed, dispatch() runs either kind
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            # Get the appropriate handler method
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        # Authenticate in a worker thread, since it may query the database. The remaining
+        # checks in initial() then use the authenticated user without blocking the loop.
+        await sync_to_async(self.perform_authentication)(request)
+        self.initial(request, *args, **kwargs)
+
+
+# Connection pool usage of this process, to help size the pool
+class DatabasePoolStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,111 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.response import Response
+from project.caches import is_process_local
+from project.metrics import count_cache_lookup
+
+from .conditional import set_validators
+
+
+def get_cache():
+    return caches[settings.WORKOUTS_CACHE]
+
+
+# Responses are only cached in a cache every process shares. A write bumping the generation
+# in a process-local cache would leave the other processes serving stale responses.
+def caching_enabled():
+    return not is_process_local(get_cache())
+
+
+def generation_key(user_id):
+    return f'workouts:{user_id}:generation'
+
+
+def modified_key(user_id):
+    return f'workouts:{user_id}:modified'
+
+
+# Generation of the user's workout data, and the time of their last write, None once evicted.
+# Cached responses are keyed by the generation, so bumping it invalidates all of them at once.
+def get_generation(user_id):
+    cache = get_cache()
+    values = cache.get_many([generation_key(user_id), modified_key(user_id)])
+    generation = values.get(generation_key(user_id))
+    if generation is None:
+        # Start from the current time, so an evicted generation is never handed out again
+        cache.add(generation_key(user_id), time.time_ns(), None)
+        generation = cache.get(generation_key(user_id))
+    return generation, values.get(modified_key(user_id))
+
+
+# Called by every view that changes the user's workouts, exercises or sets. incr() is atomic,
+# so concurrent writes each get a generation of their own.
+def bump_generation(user_id):
+    if not caching_enabled():
+        return
+    cache = get_cache()
+    try:
+        cache.incr(generation_key(user_id))
+    except ValueError:
+        if not cache.add(generation_key(user_id), time.time_ns(), None):
+            cache.incr(generation_key(user_id))
+    cache.set(modified_key(user_id), time.time(), None)
+
+
+# Only successful responses and missing objects are cached
+CACHED_STATUSES = (status.HTTP_200_OK, status.HTTP_404_NOT_FOUND)
+
+
+# Last-Modified has whole seconds, so it is only sent once the second of the last write is
+# over. Until then another write could land in the same second and leave it unchanged, and
+# clients sending only If-Modified-Since would get a 304 for stale data.
+def generation_validators(user_id, generation, modified):
+    etag = f'W/"{user_id}-{generation}"'
+    if modified is None or int(modified) >= int(time.time()):
+        return etag, None
+    return etag, int(modified)
+
+
+def response_key(user_id, generation, request):
+    path_hash = hashlib.sha256(request.get_full_path().encode()).hexdigest()
+    return f'workouts:{user_id}:{generation}:{path_hash}'
+
+
+# Caches the responses of a read view per user until the user's data changes. Responses
+# carry an ETag taken from the generation and the time of the last write as Last-Modified,
+# so a client that already has the current response gets a 304 without the view running at
+# all. Without a shared cache, responses are neither cached nor given validators.
+def cache_per_user(view_method):
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not caching_enabled():
+            return view_method(self, request, *args, **kwargs)
+        user_id = request.user.id
+        generation, modified = get_generation(user_id)
+        etag, last_modified = generation_validators(user_id, generation, modified)
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        key = response_key(user_id, generation, request)
+        cached = get_cache().get(key)
+        count_cache_lookup('workouts_responses', cached is not None)
+        if cached is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code not in CACHED_STATUSES:
+                return response
+            get_cache().set(key, (response.data, response.status_code), settings.WORKOUTS_CACHE_TIMEOUT)
+        else:
+            data, status_code = cached
+            response = Response(data, status=status_code)
+
+        return set_validators(response, etag, last_modified)
+
+    return wrapper
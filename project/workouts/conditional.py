@@ -0,0 +1,48 @@
+import functools
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+
+
+# Sets the validators on a successful response. Clients must check with the server before
+# reusing a response, which the validators make cheap.
+def set_validators(response, etag, last_modified=None):
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+# Answers conditional GETs before the view serializes anything. validators_func is called
+# with the view's arguments and returns what the response depends on, along with the time
+# it last changed, both computed cheaply from the data, e.g. with one aggregate query.
+# Changes that leave no row behind to date them, like deletions, only show in the ETag, so
+# data that can change that way must return None for the time and go without Last-Modified.
+def conditional(validators_func):
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            etag, last_modified = validators(*validators_func(request, *args, **kwargs))
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            response = view_method(self, request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+
+        return wrapper
+
+    return decorator
+
+
+# The ETag and Last-Modified timestamp of what a response depends on
+def validators(parts, last_modified):
+    etag = 'W/"%s"' % hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return etag, last_modified
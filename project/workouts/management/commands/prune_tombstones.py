@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from workouts.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete the tombstones older than WORKOUTS_SYNC_TOMBSTONE_DAYS, which no sync cursor can need'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.WORKOUTS_SYNC_TOMBSTONE_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} tombstones')
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from workouts.cache import bump_generation
+from workouts.models import Exercise, PersonalRecord, Set
+from workouts.records import rebuild_records
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the personal records of every exercise, or of one user, from the full set history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username whose records are rebuilt')
+        parser.add_argument('--batch-size', type=int, default=settings.WORKOUTS_EXPORT_CHUNK_SIZE,
+                            help='Sets read and records written at a time')
+
+    def handle(self, *args, **options):
+        exercises = Exercise.objects.all()
+        records = PersonalRecord.objects.all()
+        sets = Set.objects.all()
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist')
+            exercises = exercises.filter(user=user)
+            records = records.filter(user=user)
+            sets = sets.filter(user=user)
+
+        with transaction.atomic():
+            # Lock the exercises first, as the set write paths do, so no set updates or adds
+            # records between deleting them and writing them again
+            list(exercises.select_for_update().order_by('id').values_list('id'))
+            records.delete()
+            written = rebuild_records(sets, options['batch_size'])
+
+        # Cached record responses are stale now
+        for user_id in sets.order_by().values_list('user_id', flat=True).distinct():
+            bump_generation(user_id)
+        self.stdout.write(f'Rebuilt {written} personal records')
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from workouts.models import Set
+from workouts.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill the training volume rollups from the full set history, and correct any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username whose rollups are reconciled')
+        parser.add_argument('--chunk', type=int, default=500, help='Users reconciled per transaction')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            try:
+                user_ids = [User.objects.get(username=options['user']).id]
+            except User.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist')
+        else:
+            user_ids = list(Set.objects.order_by('user_id').values_list('user_id', flat=True).distinct())
+            # Users without sets may still have rollups left over
+            user_ids = sorted(set(user_ids) | set(
+                User.objects.filter(volumerollup__isnull=False).values_list('id', flat=True)))
+
+        totals = [0, 0, 0]
+        for first in range(0, len(user_ids), options['chunk']):
+            with transaction.atomic():
+                counts = reconcile_rollups(user_ids[first:first + options['chunk']])
+            totals = [total + count for total, count in zip(totals, counts)]
+        self.stdout.write('Created {}, updated {} and deleted {} volume rollups'.format(*totals))
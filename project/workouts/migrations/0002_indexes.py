@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['user', 'workout'], name='exercise_user_workout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['user', 'created_at'], include=('id', 'exercise', 'weight', 'reps'), name='set_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['exercise', 'created_at'], name='set_exercise_created_idx'),
+        ),
+    ]
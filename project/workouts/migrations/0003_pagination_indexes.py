@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0002_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='set',
+            index=models.Index(fields=['created_at', 'id'], name='set_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['created_at', 'id'], name='workout_created_idx'),
+        ),
+    ]
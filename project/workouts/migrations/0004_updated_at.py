@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0003_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0004_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['user', 'updated_at'], name='exercise_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'updated_at'], name='workout_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0005_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='last_progressed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
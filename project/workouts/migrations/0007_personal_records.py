@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0006_progression'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('weight', models.IntegerField()),
+                ('reps', models.IntegerField()),
+                ('value', models.FloatField()),
+                ('achieved_at', models.DateTimeField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='workouts.exercise')),
+                ('set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='workouts.set')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'exercise'], name='record_user_exercise_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('kind', 'max_reps'), _negated=True), fields=('exercise', 'kind'), name='record_exercise_kind_unique'), models.UniqueConstraint(condition=models.Q(('kind', 'max_reps')), fields=('exercise', 'weight'), name='record_exercise_weight_unique')],
+            },
+        ),
+    ]
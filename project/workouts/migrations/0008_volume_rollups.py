@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0007_personal_records'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VolumeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10)),
+                ('bucket', models.DateField()),
+                ('volume', models.BigIntegerField()),
+                ('set_count', models.IntegerField()),
+                ('top_weight', models.IntegerField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='workouts.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'period', 'bucket'], name='rollup_user_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('exercise', 'period', 'bucket'), name='rollup_exercise_bucket_unique')],
+            },
+        ),
+    ]
@@ -5,6 +5,15 @@ class Workout(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin workout list
+            models.Index(fields=['created_at', 'id'], name='workout_created_idx'),
+            # Workouts changed since a sync cursor
+            models.Index(fields=['user', 'updated_at'], name='workout_user_updated_idx'),
+        ]
 
 class Exercise(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -14,6 +23,17 @@ class Exercise(models.Model):
     target_sets = models.IntegerField()
     target_reps = models.IntegerField()
     weight_modifier = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    # When current_weight was last progressed, so a session progresses it at most once
+    last_progressed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Exercises of one of the user's workouts
+            models.Index(fields=['user', 'workout'], name='exercise_user_workout_idx'),
+            # Exercises changed since a sync cursor
+            models.Index(fields=['user', 'updated_at'], name='exercise_user_updated_idx'),
+        ]
 
 class Set(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -21,3 +41,78 @@ class Set(models.Model):
     weight = models.IntegerField()
     reps = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The user's recent sets, covering the columns read by the summary and
+            # progression queries so Postgres can answer them with index-only scans
+            models.Index(fields=['user', 'created_at'], name='set_user_created_idx',
+                         include=['id', 'exercise', 'weight', 'reps']),
+            # The sets of an exercise, in the order they were performed
+            models.Index(fields=['exercise', 'created_at'], name='set_exercise_created_idx'),
+            # Keyset pagination of the admin set list
+            models.Index(fields=['created_at', 'id'], name='set_created_idx'),
+        ]
+
+
+# Records a deleted workout, exercise or set, so delta sync can tell clients to drop it.
+# Deleting a workout or exercise also deletes its children, which get no tombstone of their own.
+class Tombstone(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Deletions since a sync cursor
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+
+# The best set of an exercise by one measure, kept up to date by the set write paths in
+# records.py. There is one max_weight and one estimated_1rm record per exercise, and one
+# max_reps record per exercise and weight.
+class PersonalRecord(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    # The set holding the record, whose deletion deletes the record until it is recomputed
+    set = models.ForeignKey(Set, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20)
+    weight = models.IntegerField()
+    reps = models.IntegerField()
+    value = models.FloatField()
+    achieved_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exercise', 'kind'], condition=~models.Q(kind='max_reps'),
+                                    name='record_exercise_kind_unique'),
+            models.UniqueConstraint(fields=['exercise', 'weight'], condition=models.Q(kind='max_reps'),
+                                    name='record_exercise_weight_unique'),
+        ]
+        indexes = [
+            # The records of a user's exercises
+            models.Index(fields=['user', 'exercise'], name='record_user_exercise_idx'),
+        ]
+
+
+# Training volume of an exercise per day or per week, starting on Monday, in the default time
+# zone. Kept up to date by the set write paths in rollups.py, so charts need not scan every set.
+class VolumeRollup(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10)
+    bucket = models.DateField()
+    volume = models.BigIntegerField()
+    set_count = models.IntegerField()
+    top_weight = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exercise', 'period', 'bucket'], name='rollup_exercise_bucket_unique'),
+        ]
+        indexes = [
+            # The user's buckets of a period over a range of dates
+            models.Index(fields=['user', 'period', 'bucket'], name='rollup_user_bucket_idx'),
+        ]
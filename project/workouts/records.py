@@ -0,0 +1,130 @@
+from itertools import groupby
+from operator import attrgetter
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+from .models import Exercise, PersonalRecord, Set
+
+MAX_WEIGHT = 'max_weight'
+ESTIMATED_1RM = 'estimated_1rm'
+MAX_REPS = 'max_reps'
+
+RECORD_FIELDS = ['set', 'weight', 'reps', 'value', 'achieved_at']
+
+
+# Epley's estimate of the heaviest weight that could be lifted for a single rep
+def estimated_one_rep_max(weight, reps):
+    return weight * (30 + reps) / 30
+
+
+# Records are identified by their kind, and by their weight for max_reps
+def record_key(record):
+    return (record.kind, record.weight if record.kind == MAX_REPS else None)
+
+
+# The value of a set for a kind of record
+def record_value(kind, set_):
+    if kind == MAX_WEIGHT:
+        return set_.weight
+    if kind == ESTIMATED_1RM:
+        return estimated_one_rep_max(set_.weight, set_.reps)
+    return set_.reps
+
+
+# The best of the given sets for each record, as (value, set) by record key. Sets must be in
+# the order they were performed, so ties go to the set that reached the value first.
+def best_sets(sets):
+    best = {}
+    for set_ in sets:
+        for kind in (MAX_WEIGHT, ESTIMATED_1RM, MAX_REPS):
+            key = (kind, set_.weight if kind == MAX_REPS else None)
+            value = record_value(kind, set_)
+            if key not in best or value > best[key][0]:
+                best[key] = (value, set_)
+    return best
+
+
+def new_record(key, value, set_):
+    return PersonalRecord(user_id=set_.user_id, exercise_id=set_.exercise_id, set_id=set_.id, kind=key[0],
+                          weight=set_.weight, reps=set_.reps, value=value, achieved_at=set_.created_at)
+
+
+# Keeps concurrent writers of an exercise's sets from updating its records at the same time
+def lock_records(exercise_id):
+    Exercise.objects.select_for_update().only('id').get(id=exercise_id)
+
+
+# Updates the records of an exercise with its newly created sets, in a constant number of
+# queries. Must run in the transaction creating the sets.
+def record_sets(exercise_id, sets):
+    lock_records(exercise_id)
+    best = best_sets(sets)
+    weights = [weight for kind, weight in best if kind == MAX_REPS]
+    current = {
+        record_key(record): record for record in PersonalRecord.objects.filter(
+            Q(kind__in=[MAX_WEIGHT, ESTIMATED_1RM]) | Q(kind=MAX_REPS, weight__in=weights),
+            exercise_id=exercise_id,
+        )
+    }
+
+    created, updated = [], []
+    for key, (value, set_) in best.items():
+        record = current.get(key)
+        if record is None:
+            created.append(new_record(key, value, set_))
+        elif value > record.value:
+            record.set_id, record.weight, record.reps = set_.id, set_.weight, set_.reps
+            record.value, record.achieved_at = value, set_.created_at
+            updated.append(record)
+
+    if created:
+        PersonalRecord.objects.bulk_create(created)
+    if updated:
+        PersonalRecord.objects.bulk_update(updated, RECORD_FIELDS)
+
+
+# Keys of the records held by a set about to be deleted. Deleting the set deletes them. Must
+# run in the transaction deleting the set, after the exercise was locked.
+def held_records(set_):
+    return [record_key(record) for record in PersonalRecord.objects.filter(set=set_)]
+
+
+# Recomputes the given records of an exercise from its remaining sets, after the set that
+# held them was deleted. Must run in the transaction deleting the set.
+def recompute_records(exercise_id, keys):
+    remaining = Set.objects.filter(exercise_id=exercise_id)
+    records = []
+    for key in keys:
+        kind, weight = key
+        if kind == MAX_WEIGHT:
+            best = remaining.order_by('-weight', 'created_at', 'id').first()
+        elif kind == ESTIMATED_1RM:
+            best = remaining.annotate(estimated_1rm=Cast(F('weight') * (F('reps') + 30), FloatField()) / 30).order_by(
+                '-estimated_1rm', 'created_at', 'id').first()
+        else:
+            best = remaining.filter(weight=weight).order_by('-reps', 'created_at', 'id').first()
+
+        # Records are dropped along with the last set of their exercise or weight
+        if best is not None:
+            records.append(new_record(key, record_value(kind, best), best))
+    PersonalRecord.objects.bulk_create(records)
+
+
+# Rebuilds the records of the exercises of the given sets from scratch, reading the sets in
+# one ordered pass and writing the records in batches. Returns the number of records written.
+def rebuild_records(sets, batch_size):
+    rows = sets.order_by('exercise_id', 'created_at', 'id').values_list(
+        'id', 'user_id', 'exercise_id', 'weight', 'reps', 'created_at', named=True,
+    ).iterator(chunk_size=batch_size)
+
+    written = 0
+    records = []
+    for _, exercise_sets in groupby(rows, key=attrgetter('exercise_id')):
+        records += [new_record(key, value, set_) for key, (value, set_) in best_sets(exercise_sets).items()]
+        if len(records) >= batch_size:
+            PersonalRecord.objects.bulk_create(records)
+            written += len(records)
+            records = []
+    PersonalRecord.objects.bulk_create(records)
+    return written + len(records)
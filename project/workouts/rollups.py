@@ -0,0 +1,121 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import Count, DateField, F, Max, Sum
+from django.db.models.functions import Greatest, Trunc
+from django.utils import timezone
+
+from .models import Exercise, Set, VolumeRollup
+
+PERIODS = ('day', 'week')
+PERIOD_LENGTHS = {'day': datetime.timedelta(days=1), 'week': datetime.timedelta(weeks=1)}
+ROLLUP_FIELDS = ['volume', 'set_count', 'top_weight']
+
+
+# The first day of the bucket of the period holding the given date
+def bucket_of(period, day):
+    return day if period == 'day' else day - datetime.timedelta(days=day.weekday())
+
+
+# The first day of the bucket of the period holding the given moment, in the default time zone
+def bucket_at(period, moment):
+    return bucket_of(period, timezone.localtime(moment, timezone.get_default_timezone()).date())
+
+
+# The moments the bucket starts and ends at
+def bucket_range(period, bucket):
+    start = datetime.datetime.combine(bucket, datetime.time.min, tzinfo=timezone.get_default_timezone())
+    return start, start + PERIOD_LENGTHS[period]
+
+
+# The sets grouped into buckets of the period, with the totals of each bucket
+def bucket_totals(sets, period):
+    bucket = Trunc('created_at', period, output_field=DateField(), tzinfo=timezone.get_default_timezone())
+    return sets.annotate(bucket=bucket).values('user_id', 'exercise_id', 'bucket').annotate(
+        volume=Sum(F('weight') * F('reps')),
+        set_count=Count('id'),
+        top_weight=Max('weight'),
+    ).order_by()
+
+
+# Adds newly created sets of an exercise to its rollups, in a constant number of queries.
+# Must run in the transaction creating the sets, after the exercise was locked.
+def add_sets(user_id, exercise_id, sets):
+    totals = defaultdict(lambda: [0, 0, 0])
+    for set_ in sets:
+        for period in PERIODS:
+            total = totals[period, bucket_at(period, set_.created_at)]
+            total[0] += set_.weight * set_.reps
+            total[1] += 1
+            total[2] = max(total[2], set_.weight)
+
+    created = []
+    for (period, bucket), (volume, set_count, top_weight) in totals.items():
+        updated = VolumeRollup.objects.filter(exercise_id=exercise_id, period=period, bucket=bucket).update(
+            volume=F('volume') + volume,
+            set_count=F('set_count') + set_count,
+            top_weight=Greatest('top_weight', top_weight),
+        )
+        if not updated:
+            created.append(VolumeRollup(user_id=user_id, exercise_id=exercise_id, period=period, bucket=bucket,
+                                        volume=volume, set_count=set_count, top_weight=top_weight))
+    VolumeRollup.objects.bulk_create(created)
+
+
+# Removes a deleted set from its rollups. The top weight is only recomputed from the bucket's
+# remaining sets when the set held it. Must run in the transaction deleting the set, after
+# the exercise was locked and the set was deleted.
+def remove_set(set_):
+    buckets = {period: bucket_at(period, set_.created_at) for period in PERIODS}
+    rollups = [
+        rollup for rollup in VolumeRollup.objects.filter(
+            exercise_id=set_.exercise_id, period__in=PERIODS, bucket__in=buckets.values())
+        if buckets[rollup.period] == rollup.bucket
+    ]
+
+    updated, emptied = [], []
+    for rollup in rollups:
+        if rollup.set_count <= 1:
+            emptied.append(rollup.id)
+            continue
+        rollup.volume -= set_.weight * set_.reps
+        rollup.set_count -= 1
+        if set_.weight >= rollup.top_weight:
+            start, end = bucket_range(rollup.period, rollup.bucket)
+            rollup.top_weight = Set.objects.filter(
+                exercise_id=set_.exercise_id, created_at__gte=start, created_at__lt=end,
+            ).aggregate(top_weight=Max('weight'))['top_weight']
+        updated.append(rollup)
+
+    if emptied:
+        VolumeRollup.objects.filter(id__in=emptied).delete()
+    if updated:
+        VolumeRollup.objects.bulk_update(updated, ROLLUP_FIELDS)
+
+
+# Brings the rollups of the given users in line with their sets, creating missing rollups,
+# correcting wrong ones and deleting those without sets. Returns how many of each there were.
+# Must run in a transaction. The users' exercises are locked first, as the set write paths
+# lock them, so no set is committed between reading the sets and writing the rollups.
+def reconcile_rollups(user_ids):
+    list(Exercise.objects.select_for_update().filter(user_id__in=user_ids).order_by('id').values_list('id'))
+    created, updated, deleted = [], [], []
+    for period in PERIODS:
+        expected = {
+            (row['exercise_id'], row['bucket']): row
+            for row in bucket_totals(Set.objects.filter(user_id__in=user_ids), period)
+        }
+        for rollup in VolumeRollup.objects.filter(user_id__in=user_ids, period=period):
+            row = expected.pop((rollup.exercise_id, rollup.bucket), None)
+            if row is None:
+                deleted.append(rollup.id)
+            elif any(getattr(rollup, field) != row[field] for field in ROLLUP_FIELDS):
+                for field in ROLLUP_FIELDS:
+                    setattr(rollup, field, row[field])
+                updated.append(rollup)
+        created += [VolumeRollup(period=period, **row) for row in expected.values()]
+
+    VolumeRollup.objects.bulk_create(created)
+    VolumeRollup.objects.bulk_update(updated, ROLLUP_FIELDS)
+    VolumeRollup.objects.filter(id__in=deleted).delete()
+    return len(created), len(updated), len(deleted)
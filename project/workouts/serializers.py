@@ -1,17 +1,156 @@
+import copy
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+from project.instrumentation import timed_method
+from project.serializers import ModelSerializer, Serializer
 from .models import *
 
-class WorkoutSerializer(serializers.ModelSerializer):
+
+# Serializes rows from QuerySet.values() exactly like the given ModelSerializer serializes
+# instances, without building a serializer or loading a model instance per row
+class ValuesSerializer:
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._fields = None
+
+    @property
+    def fields(self):
+        # Resolve the fields once, on first use
+        if self._fields is None:
+            self._fields = [
+                # values() already returns the primary key of related fields
+                (name, None if isinstance(field, serializers.RelatedField) else field)
+                for name, field in self.serializer_class().fields.items()
+            ]
+        return self._fields
+
+    @property
+    def value_names(self):
+        return [name for name, _ in self.fields]
+
+    # The to_representation of each field. DateTimeField looks up the current timezone for
+    # every value unless it has one of its own, so give it the current one up front
+    def representations(self):
+        current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        representations = []
+        for name, field in self.fields:
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                field = copy.copy(field)
+                field.timezone = current_timezone
+            representations.append((name, field and field.to_representation))
+        return representations
+
+    def to_representation(self, row):
+        return self.rows([row])[0]
+
+    @timed_method('serialize')
+    def rows(self, rows):
+        representations = self.representations()
+        return [
+            {
+                name: value if to_representation is None or value is None else to_representation(value)
+                for name, to_representation in representations
+                for value in (row[name],)
+            }
+            for row in rows
+        ]
+
+    # Serializes every row of the queryset, reading only the serialized columns
+    def many(self, queryset):
+        return self.rows(queryset.values(*self.value_names))
+
+class WorkoutSerializer(ModelSerializer):
     class Meta:
         model = Workout
         fields = '__all__'
 
-class ExerciseSerializer(serializers.ModelSerializer):
+class ExerciseSerializer(ModelSerializer):
     class Meta:
         model = Exercise
         fields = '__all__'
 
-class SetSerializer(serializers.ModelSerializer):
+class SetSerializer(ModelSerializer):
     class Meta:
         model = Set
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+# An exercise with the sets of its most recent session, prefetched into last_session
+class ExpandedExerciseSerializer(ExerciseSerializer):
+    last_session = SetSerializer(many=True, read_only=True)
+
+# A workout with its exercises, prefetched into exercises. Pass expand to choose which
+# of 'exercises' and 'last_session' are included
+class ExpandedWorkoutSerializer(WorkoutSerializer):
+    exercises = ExpandedExerciseSerializer(many=True, read_only=True)
+
+    def __init__(self, *args, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'exercises' not in expand:
+            self.fields.pop('exercises')
+        elif 'last_session' not in expand:
+            self.fields['exercises'].child.fields.pop('last_session')
+
+# Validates a workout whose user is set by the view
+class WorkoutWriteSerializer(ModelSerializer):
+    class Meta:
+        model = Workout
+        fields = '__all__'
+        read_only_fields = ['user']
+
+# Validates exercises sent along with a workout, whose user and workout are set by the view
+class ExerciseWriteSerializer(ModelSerializer):
+    class Meta:
+        model = Exercise
+        fields = '__all__'
+        read_only_fields = ['user', 'workout', 'last_progressed_at']
+
+# Validates exercises sent when editing a workout, where existing exercises are identified by id
+class ExerciseUpdateSerializer(ExerciseWriteSerializer):
+    id = serializers.IntegerField(required=False)
+
+# Validates sets logged for an exercise, whose user and exercise are set by the view
+class SetWriteSerializer(ModelSerializer):
+    class Meta:
+        model = Set
+        fields = '__all__'
+        read_only_fields = ['user', 'exercise']
+
+class PersonalRecordSerializer(ModelSerializer):
+    class Meta:
+        model = PersonalRecord
+        fields = '__all__'
+
+# Validates the ids of the exercises to progress
+class ProgressionSerializer(Serializer):
+    exercises = serializers.ListField(child=serializers.IntegerField(), default=list)
+
+VOLUME_FIELDS = ['bucket', 'volume', 'set_count', 'top_weight']
+
+class VolumeRollupSerializer(ModelSerializer):
+    class Meta:
+        model = VolumeRollup
+        fields = ['exercise'] + VOLUME_FIELDS
+
+# Validates the range of a training volume query, a year up to today by default
+class VolumeQuerySerializer(Serializer):
+    period = serializers.ChoiceField(choices=['day', 'week'], default='week')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    exercise = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate(timezone=timezone.get_default_timezone()))
+        data.setdefault('start', data['end'] - timedelta(days=365))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+
+workout_values_serializer = ValuesSerializer(WorkoutSerializer)
+exercise_values_serializer = ValuesSerializer(ExerciseSerializer)
+set_values_serializer = ValuesSerializer(SetSerializer)
+personal_record_values_serializer = ValuesSerializer(PersonalRecordSerializer)
+volume_values_serializer = ValuesSerializer(VolumeRollupSerializer)
@@ -1,13 +1,39 @@
 from rest_framework import status
 from django.urls import reverse
-from .serializers import WorkoutSerializer, ExerciseSerializer, SetSerializer
-from .models import Workout, Exercise, Set
+from .serializers import (WorkoutSerializer, ExerciseSerializer, SetSerializer, workout_values_serializer,
+                          exercise_values_serializer, set_values_serializer)
+from .models import Workout, Exercise, Set, Tombstone, PersonalRecord, VolumeRollup
+from .cache import bump_generation, get_generation
+from .records import rebuild_records
+from authentication.authentication import CachedTokenAuthentication, local_tokens
 from authentication.tests import AuthAPIBaseTestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITransactionTestCase
+from django.core import signing
+from django.core.management import call_command
+from django.db import connection
+from unittest import mock, skipUnless
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.http import http_date
 from datetime import timedelta
+import csv
+import json
+import threading
+import time
+from io import StringIO
+from project.tests import PROCESS_LOCAL_CACHES, SHARED_CACHES
 
 
 class WorkoutBaseTestCase(AuthAPIBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Cache the token up front, so query counts only cover the view itself
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
     def create_exercise_and_set(self, exercise_name, set_data, created_at):
         # Create an exercise and a set associated with that exercise
         workout = Workout.objects.create(user=self.user, name='test workout')
@@ -92,7 +118,82 @@ class CreateWorkoutViewTest(WorkoutBaseTestCase):
         # Assert that the request is unsuccessful
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    # Test that the created exercises are returned with their ids
+    def test_returns_created_exercises(self):
+        url = reverse('create-workout')
+        data = {
+            "name": "new workout",
+            "exercises": [
+                {
+                    "name": "Exercise 1",
+                    "current_weight": 100,
+                    "target_sets": 3,
+                    "target_reps": 10,
+                    "weight_modifier": 10
+                }
+            ]
+        }
+
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        exercise = Exercise.objects.get(workout_id=response.data['id'])
+        self.assertEqual(response.data['exercises'],
+                         ExerciseSerializer([exercise], many=True).data)
+
+    # Test that an invalid exercise does not leave a partial workout behind
+    def test_invalid_exercise(self):
+        url = reverse('create-workout')
+        data = {
+            "name": "new workout",
+            "exercises": [
+                {
+                    "name": "Exercise 1",
+                    "current_weight": 100,
+                    "target_sets": 3,
+                    "target_reps": 10,
+                    "weight_modifier": 10
+                },
+                {
+                    "name": "Exercise 2",
+                    "current_weight": "heavy"
+                }
+            ]
+        }
+
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Workout.objects.exists())
+        self.assertFalse(Exercise.objects.exists())
+
+    # Test that the number of queries does not grow with the number of exercises
+    def test_query_count(self):
+        url = reverse('create-workout')
+
+        def workout_data(exercise_count):
+            return {
+                "name": "new workout",
+                "exercises": [
+                    {
+                        "name": f"Exercise {i}",
+                        "current_weight": 100,
+                        "target_sets": 3,
+                        "target_reps": 10,
+                        "weight_modifier": 10
+                    } for i in range(exercise_count)
+                ]
+            }
+
+        with CaptureQueriesContext(connection) as small_workout:
+            self.client.post(url, data=workout_data(1), format='json')
+        with CaptureQueriesContext(connection) as large_workout:
+            response = self.client.post(url, data=workout_data(20), format='json')
+
+        self.assertEqual(len(response.data['exercises']), 20)
+        self.assertEqual(len(large_workout), len(small_workout))
 
+
+@override_settings(CACHES=SHARED_CACHES)
 class MyWorkoutsViewTest(WorkoutBaseTestCase):
     # Test successful query
     def test_success(self):
@@ -115,6 +216,269 @@ class MyWorkoutsViewTest(WorkoutBaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, [])
 
+    # Test that repeated queries are answered from the cache
+    def test_cached(self):
+        Workout.objects.create(name='Workout 1', user=self.user)
+        url = reverse('get-my-workouts')
+        response = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_response.data, response.data)
+
+    # Test that responses are not cached where other processes would not see the writes
+    def test_process_local_cache(self):
+        url = reverse('get-my-workouts')
+        with override_settings(CACHES=PROCESS_LOCAL_CACHES):
+            self.client.get(url)
+            Workout.objects.create(name='Workout 1', user=self.user)
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 1)
+        self.assertFalse(response.has_header('ETag'))
+
+    # Test that writes through the API invalidate the cached responses
+    def test_invalidated_by_write(self):
+        url = reverse('get-my-workouts')
+        self.assertEqual(self.client.get(url).data, [])
+
+        data = {
+            "name": "new workout",
+            "exercises": [
+                {
+                    "name": "Exercise 1",
+                    "current_weight": 100,
+                    "target_sets": 3,
+                    "target_reps": 10,
+                    "weight_modifier": 10
+                }
+            ]
+        }
+        self.client.post(reverse('create-workout'), data=data, format='json')
+
+        response = self.client.get(url)
+        self.assertEqual([workout['name'] for workout in response.data], ['new workout'])
+
+    # Test that clients holding the current response get a 304 without a body
+    def test_not_modified(self):
+        url = reverse('get-my-workouts')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        workout = Workout.objects.create(name='Workout 1', user=self.user)
+        self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': workout.id}))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    # Test that deletions move Last-Modified forward, so clients sending only If-Modified-Since
+    # see them
+    def test_not_modified_since(self):
+        url = reverse('get-my-workouts')
+        workouts = [Workout.objects.create(name=f'Workout {i}', user=self.user) for i in range(2)]
+        self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': workouts[0].id}))
+        with mock.patch('workouts.cache.time.time', return_value=time.time() + 2):
+            last_modified = self.client.get(url)['Last-Modified']
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with mock.patch('workouts.cache.time.time', return_value=time.time() + 5):
+            self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': workouts[1].id}))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    # Test that Last-Modified is only sent once no other write can land in its second
+    def test_modified_same_second(self):
+        url = reverse('get-my-workouts')
+        workouts = [Workout.objects.create(name=f'Workout {i}', user=self.user) for i in range(2)]
+        with mock.patch('workouts.cache.time.time', return_value=1000.2):
+            self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': workouts[0].id}))
+        with mock.patch('workouts.cache.time.time', return_value=1000.4):
+            self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        with mock.patch('workouts.cache.time.time', return_value=1000.6):
+            self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': workouts[1].id}))
+        with mock.patch('workouts.cache.time.time', return_value=1001.0):
+            response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(1000))
+        self.assertEqual(response.data, [])
+
+    # Test that concurrent writes each get a generation of their own. The file based cache
+    # does not increment atomically, so this runs on LocMemCache, which does, like Redis.
+    @override_settings(CACHES=PROCESS_LOCAL_CACHES)
+    @mock.patch('workouts.cache.caching_enabled', return_value=True)
+    def test_concurrent_bumps(self, caching_enabled):
+        generation, modified = get_generation(self.user.id)
+
+        def bump():
+            for _ in range(50):
+                bump_generation(self.user.id)
+
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(get_generation(self.user.id)[0], generation + 400)
+
+    # Test that expanded workouts include their exercises and each exercise's last session
+    def test_expand(self):
+        workout = Workout.objects.create(name='Workout 1', user=self.user)
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='Exercise 1',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        # created_at is set on insert, so backdate the earlier session afterwards
+        earlier = Set.objects.create(user=self.user, exercise=exercise, weight=90, reps=10)
+        Set.objects.filter(id=earlier.id).update(created_at=timezone.now() - timedelta(days=2))
+        last_session = [Set.objects.create(user=self.user, exercise=exercise, weight=100, reps=reps)
+                        for reps in (10, 8)]
+
+        url = reverse('get-my-workouts')
+        response = self.client.get(url, {'expand': 'exercises'})
+        self.assertEqual(response.data[0]['exercises'], ExerciseSerializer([exercise], many=True).data)
+
+        response = self.client.get(url, {'expand': 'exercises,last_session'})
+        self.assertEqual(response.data[0]['exercises'][0]['last_session'],
+                         SetSerializer(last_session, many=True).data)
+
+    # Test that unknown expansions are rejected
+    def test_expand_unknown(self):
+        response = self.client.get(reverse('get-my-workouts'), {'expand': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that expanding does not cost a query per workout or exercise
+    def test_expand_query_count(self):
+        for i in range(5):
+            workout = Workout.objects.create(name=f'Workout {i}', user=self.user)
+            for j in range(3):
+                exercise = Exercise.objects.create(user=self.user, workout=workout, name=f'Exercise {j}',
+                                                   current_weight=100, target_sets=3, target_reps=10,
+                                                   weight_modifier=5)
+                Set.objects.create(user=self.user, exercise=exercise, weight=100, reps=10)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('get-my-workouts'), {'expand': 'last_session'})
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(response.data[4]['exercises'][2]['last_session']), 1)
+
+
+class WorkoutUpdateDeleteViewTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workout = Workout.objects.create(user=self.user, name='test workout')
+        self.kept = Exercise.objects.create(user=self.user, workout=self.workout, name='kept',
+                                            current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        self.removed = Exercise.objects.create(user=self.user, workout=self.workout, name='removed',
+                                               current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        self.kept_set = Set.objects.create(user=self.user, exercise=self.kept, weight=100, reps=10)
+        self.url = reverse('modify-delete-workout', kwargs={'workout_id': self.workout.id})
+
+    def exercise_data(self, exercise, **changes):
+        data = {
+            "id": exercise.id,
+            "name": exercise.name,
+            "current_weight": exercise.current_weight,
+            "target_sets": exercise.target_sets,
+            "target_reps": exercise.target_reps,
+            "weight_modifier": exercise.weight_modifier
+        }
+        data.update(changes)
+        return data
+
+    # Test that existing exercises are updated in place, new ones created and missing ones deleted
+    def test_update_success(self):
+        data = {
+            "name": "renamed workout",
+            "exercises": [
+                self.exercise_data(self.kept, current_weight=110),
+                {
+                    "name": "added",
+                    "current_weight": 50,
+                    "target_sets": 3,
+                    "target_reps": 10,
+                    "weight_modifier": 5
+                }
+            ]
+        }
+
+        response = self.client.put(self.url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.workout.refresh_from_db()
+        self.assertEqual(self.workout.name, 'renamed workout')
+
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.current_weight, 110)
+        self.assertTrue(Set.objects.filter(id=self.kept_set.id).exists())
+
+        self.assertFalse(Exercise.objects.filter(id=self.removed.id).exists())
+        self.assertTrue(Exercise.objects.filter(workout=self.workout, name='added').exists())
+
+    # Test that edited exercises and workouts get a new modification time
+    def test_updated_at(self):
+        updated_at = self.kept.updated_at
+        data = {
+            "name": "renamed workout",
+            "exercises": [self.exercise_data(self.kept, current_weight=110), self.exercise_data(self.removed)]
+        }
+        self.client.put(self.url, data=data, format='json')
+
+        self.kept.refresh_from_db()
+        self.removed.refresh_from_db()
+        self.workout.refresh_from_db()
+        self.assertGreater(self.kept.updated_at, updated_at)
+        self.assertGreater(self.workout.updated_at, updated_at)
+        self.assertLess(self.removed.updated_at, self.kept.updated_at)
+
+    # Test that a rename alone leaves the exercises untouched
+    def test_rename_only(self):
+        response = self.client.put(self.url, data={"name": "renamed workout"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Exercise.objects.filter(workout=self.workout).count(), 2)
+
+    # Test that an exercise from another workout is rejected without changing anything
+    def test_unknown_exercise(self):
+        other_workout = Workout.objects.create(user=self.user, name='other workout')
+        other = Exercise.objects.create(user=self.user, workout=other_workout, name='other',
+                                        current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        data = {
+            "name": "renamed workout",
+            "exercises": [self.exercise_data(other, current_weight=110)]
+        }
+
+        response = self.client.put(self.url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.workout.refresh_from_db()
+        self.assertEqual(self.workout.name, 'test workout')
+        self.assertEqual(Exercise.objects.filter(workout=self.workout).count(), 2)
+
+    # Test that the number of queries does not grow with the number of edited exercises
+    def test_query_count(self):
+        extra = [
+            Exercise.objects.create(user=self.user, workout=self.workout, name=f'extra {i}',
+                                    current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+            for i in range(10)
+        ]
+
+        with CaptureQueriesContext(connection) as small_edit:
+            self.client.put(self.url, data={"exercises": [
+                self.exercise_data(self.kept, current_weight=110),
+                self.exercise_data(self.removed),
+            ] + [self.exercise_data(exercise) for exercise in extra]}, format='json')
+        with CaptureQueriesContext(connection) as large_edit:
+            self.client.put(self.url, data={"exercises": [
+                self.exercise_data(self.kept, current_weight=120),
+                self.exercise_data(self.removed, current_weight=120),
+            ] + [self.exercise_data(exercise, current_weight=120) for exercise in extra]}, format='json')
+
+        self.assertEqual(Exercise.objects.filter(workout=self.workout, current_weight=120).count(), 12)
+        self.assertEqual(len(large_edit), len(small_edit))
+
 
 class SetsAPIViewTest(WorkoutBaseTestCase):
     # Test successful query
@@ -147,6 +511,62 @@ class SetsAPIViewTest(WorkoutBaseTestCase):
             self.assertIsNotNone(
                 set_obj, f"Set {i+1} not found in the database.")
 
+    # Test that the created sets are returned with their ids and timestamps
+    def test_create_returns_rows(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        data = [{"weight": 50, "reps": 10}, {"weight": 60, "reps": 8}]
+
+        url = reverse('create-get-sets', kwargs={'exercise_id': exercise.id})
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        sets = Set.objects.filter(exercise=exercise).order_by('id')
+        self.assertEqual(response.data, SetSerializer(sets, many=True).data)
+
+    # Test that an invalid set does not create any of the others
+    def test_create_invalid_set(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        data = [{"weight": 50, "reps": 10}, {"weight": 60}]
+
+        url = reverse('create-get-sets', kwargs={'exercise_id': exercise.id})
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Set.objects.exists())
+
+    # Test that lists larger than the batch limit are rejected
+    @override_settings(WORKOUTS_MAX_SETS_PER_REQUEST=2)
+    def test_create_too_many_sets(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        data = [{"weight": 50, "reps": 10}] * 3
+
+        url = reverse('create-get-sets', kwargs={'exercise_id': exercise.id})
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Set.objects.exists())
+
+    # Test that the number of queries does not grow with the number of sets
+    def test_create_query_count(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        url = reverse('create-get-sets', kwargs={'exercise_id': exercise.id})
+        # Set the personal records first, so neither batch below creates any
+        self.client.post(url, data=[{"weight": 50, "reps": 10}], format='json')
+
+        with CaptureQueriesContext(connection) as small_batch:
+            self.client.post(url, data=[{"weight": 50, "reps": 10}], format='json')
+        with CaptureQueriesContext(connection) as large_batch:
+            response = self.client.post(url, data=[{"weight": 50, "reps": 10}] * 50, format='json')
+
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(len(large_batch), len(small_batch))
+
     # Test successful fetch
     def test_get_success(self):
         # Create an exercise to associate with the set
@@ -180,6 +600,21 @@ class SetsAPIViewTest(WorkoutBaseTestCase):
             self.assertEqual(response.data[i]['weight'], set_data['weight'])
             self.assertEqual(response.data[i]['reps'], set_data['reps'])
 
+    # Test that sets created through the API show up in the cached list
+    def test_get_after_create(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        url = reverse('create-get-sets', kwargs={'exercise_id': exercise.id})
+        self.assertEqual(self.client.get(url).data, [])
+
+        self.client.post(url, data=[{"weight": 50, "reps": 10}], format='json')
+        response = self.client.get(url)
+        self.assertEqual([set_data['weight'] for set_data in response.data], [50])
+
+        self.client.delete(reverse('delete-set', kwargs={'set_id': response.data[0]['id']}))
+        self.assertEqual(self.client.get(url).data, [])
+
 
 class SetDeleteAPIViewTest(WorkoutBaseTestCase):
     # Test successful deletion
@@ -263,6 +698,65 @@ class WorkoutSummaryAPIViewTest(WorkoutBaseTestCase):
         self.assertEqual(response.data['exercise 2'][0]['weight'], 60)
         self.assertEqual(response.data['exercise 2'][0]['reps'], 8)
 
+    # Test that the sets are serialized exactly like SetSerializer does
+    def test_matches_set_serializer(self):
+        self.create_exercise_and_set('exercise 1', {'weight': 50, 'reps': 10}, timezone.now())
+
+        response = self.client.get(reverse('workout-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['exercise 1'],
+                         SetSerializer(Set.objects.all(), many=True).data)
+
+    # Test that per exercise aggregates are included when requested
+    def test_aggregates(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='exercise 1',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        Set.objects.create(user=self.user, exercise=exercise, weight=50, reps=10)
+        Set.objects.create(user=self.user, exercise=exercise, weight=60, reps=8)
+
+        response = self.client.get(reverse('workout-summary'), {'aggregates': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['sets']['exercise 1']), 2)
+        self.assertEqual(response.data['aggregates'], {
+            'exercise 1': {'total_volume': 980, 'max_weight': 60, 'set_count': 2}
+        })
+
+    # Test that the number of queries does not grow with the number of sets
+    def test_query_count(self):
+        url = reverse('workout-summary')
+        self.create_exercise_and_set('exercise 0', {'weight': 50, 'reps': 10}, timezone.now())
+
+        with CaptureQueriesContext(connection) as small_session:
+            self.client.get(url)
+        for i in range(1, 20):
+            self.create_exercise_and_set(f'exercise {i}', {'weight': 50, 'reps': 10}, timezone.now())
+        with CaptureQueriesContext(connection) as large_session:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(len(large_session), len(small_session))
+
+    # Test that unchanged summaries are answered with a 304 after one aggregate query
+    def test_not_modified(self):
+        self.create_exercise_and_set('exercise 1', {'weight': 50, 'reps': 10}, timezone.now())
+        url = reverse('workout-summary')
+        response = self.client.get(url)
+        # Deletions leave no time behind, so only the ETag tells the summary changed
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Deleting a set changes the ETag
+        set_id = Set.objects.get().id
+        self.client.delete(reverse('delete-set', kwargs={'set_id': set_id}))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {})
+
 
 class ExerciseProgressionAPIViewTest(WorkoutBaseTestCase):
     def test_exercise_progression_results(self):
@@ -291,4 +785,694 @@ class ExerciseProgressionAPIViewTest(WorkoutBaseTestCase):
         self.create_exercise_and_set(exercise_name=exercise_name, set_data=set_data_2, created_at=now - timedelta(hours=1))
         self.create_exercise_and_set(exercise_name=exercise_name, set_data=set_data_3, created_at=now - timedelta(minutes=30))
         response = self.client.get(url)  # Replace with your actual URL
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+    # Test that only exercises whose recent sets all meet the goals are returned
+    def test_exercise_progression_eligibility(self):
+        now = timezone.now()
+        url = reverse('progress-exercises')
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        eligible = Exercise.objects.create(user=self.user, workout=workout, name='eligible',
+                                           current_weight=100, target_sets=2, target_reps=10, weight_modifier=5)
+        failed = Exercise.objects.create(user=self.user, workout=workout, name='failed',
+                                         current_weight=100, target_sets=2, target_reps=10, weight_modifier=5)
+
+        Set.objects.create(user=self.user, exercise=eligible, weight=100, reps=10)
+        Set.objects.create(user=self.user, exercise=eligible, weight=105, reps=12)
+        Set.objects.create(user=self.user, exercise=failed, weight=100, reps=10)
+        Set.objects.create(user=self.user, exercise=failed, weight=100, reps=9)
+
+        # Sets older than 4 hours are ignored
+        old_set = Set.objects.create(user=self.user, exercise=eligible, weight=10, reps=1)
+        Set.objects.filter(id=old_set.id).update(created_at=now - timedelta(hours=5))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([exercise['id'] for exercise in response.data], [eligible.id])
+
+    # Test that the number of queries does not grow with the session size
+    def test_exercise_progression_query_count(self):
+        url = reverse('progress-exercises')
+        workout = Workout.objects.create(user=self.user, name='test workout')
+
+        def add_session(exercise_count):
+            for i in range(exercise_count):
+                exercise = Exercise.objects.create(user=self.user, workout=workout, name=f'exercise {i}',
+                                                   current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+                Set.objects.bulk_create([
+                    Set(user=self.user, exercise=exercise, weight=100, reps=10) for _ in range(3)
+                ])
+
+        add_session(1)
+        with CaptureQueriesContext(connection) as small_session:
+            self.client.get(url)
+
+        add_session(10)
+        with CaptureQueriesContext(connection) as large_session:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 11)
+        self.assertEqual(len(large_session), len(small_session))
+
+
+class SetExportViewTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        Set.objects.create(user=self.user, exercise=self.exercise, weight=50, reps=10)
+        Set.objects.create(user=self.user, exercise=self.exercise, weight=60, reps=8)
+
+    # Test that the sets are streamed as one JSON document per line
+    def test_ndjson(self):
+        response = self.client.get(reverse('export-sets'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(row['exercise'], row['workout'], row['weight'], row['reps']) for row in rows],
+                         [('test exercise', 'test workout', 50, 10), ('test exercise', 'test workout', 60, 8)])
+
+    # Test that the sets can be streamed as CSV with a header row
+    def test_csv(self):
+        response = self.client.get(reverse('export-sets'), {'output': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'workout_id', 'workout', 'exercise_id', 'exercise',
+                                   'weight', 'reps', 'created_at'])
+        self.assertEqual([row[4:7] for row in rows[1:]],
+                         [['test exercise', '50', '10'], ['test exercise', '60', '8']])
+
+    # Test that unknown output formats are rejected
+    def test_invalid_output(self):
+        response = self.client.get(reverse('export-sets'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that both formats render the timestamps the same way
+    def test_timestamps(self):
+        response = self.client.get(reverse('export-sets'))
+        ndjson = [json.loads(line)['created_at'] for line in b''.join(response.streaming_content).splitlines()]
+        response = self.client.get(reverse('export-sets'), {'output': 'csv'})
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['created_at'] for row in rows], ndjson)
+
+    # Test that under ASGI the sets are streamed from an async iterator, which is not read
+    # into memory before being sent
+    async def test_async_stream(self):
+        for output, content_type in (('ndjson', 'application/x-ndjson'), ('csv', 'text/csv')):
+            response = await self.async_client.get(reverse('export-sets'), {'output': output},
+                                                   headers={'Authorization': 'Token ' + self.token.key})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.is_async)
+            self.assertEqual(response['Content-Type'], content_type)
+            lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+            self.assertEqual(len(lines), 3 if output == 'csv' else 2)
+
+
+@override_settings(WORKOUTS_SYNC_OVERLAP_SECONDS=0)
+class SyncAPIViewTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=self.workout, name='test exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        self.set = Set.objects.create(user=self.user, exercise=self.exercise, weight=50, reps=10)
+
+    # Test that a sync without a cursor returns everything
+    def test_full_sync(self):
+        response = self.client.get(reverse('sync'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['workouts'], WorkoutSerializer([self.workout], many=True).data)
+        self.assertEqual(response.data['exercises'], ExerciseSerializer([self.exercise], many=True).data)
+        self.assertEqual(response.data['sets'], SetSerializer([self.set], many=True).data)
+        self.assertFalse(response.data['reset'])
+
+    # Test that a sync with a cursor only returns what changed since
+    def test_delta_sync(self):
+        cursor = self.client.get(reverse('sync')).data['cursor']
+
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertEqual(response.data['workouts'], [])
+        self.assertEqual(response.data['exercises'], [])
+        self.assertEqual(response.data['sets'], [])
+
+        new_set = Set.objects.create(user=self.user, exercise=self.exercise, weight=60, reps=8)
+        self.client.delete(reverse('delete-set', kwargs={'set_id': self.set.id}))
+        self.client.put(reverse('modify-delete-workout', kwargs={'workout_id': self.workout.id}),
+                        data={'name': 'renamed workout'}, format='json')
+
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertEqual([workout['name'] for workout in response.data['workouts']], ['renamed workout'])
+        self.assertEqual(response.data['exercises'], [])
+        self.assertEqual([set_data['id'] for set_data in response.data['sets']], [new_set.id])
+        self.assertEqual(response.data['deleted'], {'workouts': [], 'exercises': [], 'sets': [self.set.id]})
+
+        # Deleting a workout only records the workout itself
+        cursor = response.data['cursor']
+        self.client.delete(reverse('modify-delete-workout', kwargs={'workout_id': self.workout.id}))
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertEqual(response.data['deleted'], {'workouts': [self.workout.id], 'exercises': [], 'sets': []})
+
+    # Test that a cursor older than the tombstones starts over
+    def test_expired_cursor(self):
+        cursor = signing.dumps({'since': (timezone.now() - timedelta(days=365)).isoformat()}, salt='workouts.sync')
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(len(response.data['sets']), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('sync'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that large syncs come in pages, followed by a cursor for the changes made meanwhile
+    @override_settings(WORKOUTS_SYNC_PAGE_SIZE=2)
+    def test_pages(self):
+        sets = [self.set] + [Set.objects.create(user=self.user, exercise=self.exercise, weight=60, reps=i)
+                             for i in range(4)]
+        cursor = signing.dumps({'since': (timezone.now() - timedelta(days=365)).isoformat()}, salt='workouts.sync')
+
+        pages = []
+        while not pages or pages[-1]['more']:
+            response = self.client.get(reverse('sync'), {'cursor': cursor})
+            pages.append(response.data)
+            cursor = response.data['cursor']
+            if len(pages) == 2:
+                self.client.delete(reverse('delete-set', kwargs={'set_id': self.set.id}))
+
+        self.assertEqual([page['reset'] for page in pages], [True, False, False])
+        self.assertEqual([set_data['id'] for page in pages for set_data in page['sets']],
+                         [set_.id for set_ in sets])
+
+        # The deletion made while paging comes with the next sync
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertFalse(response.data['more'])
+        self.assertEqual(response.data['deleted']['sets'], [self.set.id])
+
+    # Test that a sync reads from before the oldest transaction still open, whose writes may
+    # commit after the sync
+    def test_open_transaction(self):
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        with mock.patch('workouts.views.oldest_transaction_start', return_value=an_hour_ago):
+            cursor = self.client.get(reverse('sync')).data['cursor']
+        response = self.client.get(reverse('sync'), {'cursor': cursor})
+        self.assertEqual([set_data['id'] for set_data in response.data['sets']], [self.set.id])
+
+    # Test that old tombstones are pruned
+    def test_prune_tombstones(self):
+        self.client.delete(reverse('delete-set', kwargs={'set_id': self.set.id}))
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=365))
+
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class ValuesSerializerTest(WorkoutBaseTestCase):
+    # Test that values() rows serialize like model instances, in whatever timezone is active
+    def test_matches_model_serializer(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        Set.objects.create(user=self.user, exercise=exercise, weight=50, reps=10)
+
+        for current_timezone in ('UTC', 'America/New_York'):
+            with timezone.override(current_timezone):
+                self.assertEqual(workout_values_serializer.many(Workout.objects.all()),
+                                 WorkoutSerializer(Workout.objects.all(), many=True).data)
+                self.assertEqual(exercise_values_serializer.many(Exercise.objects.all()),
+                                 ExerciseSerializer(Exercise.objects.all(), many=True).data)
+                self.assertEqual(set_values_serializer.many(Set.objects.all()),
+                                 SetSerializer(Set.objects.all(), many=True).data)
+
+
+class SetListAPIViewTest(WorkoutBaseTestCase):
+    # Test that the admin set list is returned one bounded page at a time
+    def test_pagination(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        for i in range(5):
+            Set.objects.create(user=self.user, exercise=exercise, weight=50 + i, reps=10)
+
+        response = self.client.get(reverse('sets-list'), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+
+        # Walk every page, newest set first
+        weights = []
+        while True:
+            weights += [set_data['weight'] for set_data in response.data['results']]
+            if response.data['next'] is None:
+                break
+            self.assertLessEqual(len(response.data['results']), 2)
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(weights, [54, 53, 52, 51, 50])
+
+    # Test that sets sharing a timestamp are paged through by id, both ways, without offsets
+    def test_same_timestamp(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        Set.objects.bulk_create([Set(user=self.user, exercise=exercise, weight=50 + i, reps=10) for i in range(5)])
+        Set.objects.update(created_at=timezone.now())
+
+        pages = []
+        response = self.client.get(reverse('sets-list'), {'page_size': 2})
+        while True:
+            pages.append([set_data['weight'] for set_data in response.data['results']])
+            if response.data['next'] is None:
+                break
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.data['next'])
+            self.assertNotIn('OFFSET', ' '.join(query['sql'] for query in queries))
+        self.assertEqual(pages, [[54, 53], [52, 51], [50]])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([set_data['weight'] for set_data in response.data['results']], [52, 51])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([set_data['weight'] for set_data in response.data['results']], [54, 53])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(reverse('sets-list'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExerciseProgressionPutTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercises = [
+            Exercise.objects.create(user=self.user, workout=workout, name=f'exercise {i}',
+                                    current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+            for i in range(3)
+        ]
+        for exercise in self.exercises:
+            Set.objects.create(user=self.user, exercise=exercise, weight=100, reps=10)
+
+    def progress(self, exercises):
+        return self.client.put(reverse('progress-exercises'),
+                               data={'exercises': [exercise.id for exercise in exercises]}, format='json')
+
+    # Test that the exercises are progressed with one UPDATE and returned with one SELECT
+    def test_progress(self):
+        with self.assertNumQueries(2):
+            response = self.progress(self.exercises[:2])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([exercise['id'] for exercise in response.data], [e.id for e in self.exercises[:2]])
+        self.assertEqual([exercise['current_weight'] for exercise in response.data], [105, 105])
+        self.assertEqual([e.current_weight for e in Exercise.objects.order_by('id')], [105, 105, 100])
+
+    # Test that a retried request does not progress the same session twice
+    def test_retry(self):
+        self.progress(self.exercises)
+        response = self.progress(self.exercises)
+        self.assertEqual(response.data, [])
+        self.assertEqual([e.current_weight for e in Exercise.objects.order_by('id')], [105, 105, 105])
+
+        # The next session can be progressed again
+        Set.objects.create(user=self.user, exercise=self.exercises[0], weight=105, reps=10)
+        response = self.progress(self.exercises)
+        self.assertEqual([exercise['current_weight'] for exercise in response.data], [110])
+
+    def test_other_user(self):
+        other_user = User.objects.create_user(username='otheruser', password='testpassword')
+        workout = Workout.objects.create(user=other_user, name='other workout')
+        other_exercise = Exercise.objects.create(user=other_user, workout=workout, name='other exercise',
+                                                 current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+
+        response = self.progress([other_exercise])
+        self.assertEqual(response.data, [])
+        other_exercise.refresh_from_db()
+        self.assertEqual(other_exercise.current_weight, 100)
+
+    def test_invalid(self):
+        response = self.client.put(reverse('progress-exercises'), data={'exercises': ['a']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PersonalRecordsTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+
+    def create_sets(self, sets):
+        url = reverse('create-get-sets', kwargs={'exercise_id': self.exercise.id})
+        return self.client.post(url, data=[{'weight': weight, 'reps': reps} for weight, reps in sets], format='json')
+
+    def records(self):
+        response = self.client.get(reverse('personal-records'))
+        return {(record['kind'], record['weight']): (record['reps'], round(record['value'], 2))
+                for record in response.data}
+
+    # Test that records are set and only replaced by better sets
+    def test_record_sets(self):
+        self.create_sets([(100, 5), (80, 12), (100, 8)])
+        self.assertEqual(self.records(), {
+            ('max_weight', 100): (5, 100),
+            ('estimated_1rm', 100): (8, 126.67),
+            ('max_reps', 100): (8, 8),
+            ('max_reps', 80): (12, 12),
+        })
+
+        self.create_sets([(100, 8), (80, 10), (110, 3), (120, 2)])
+        self.assertEqual(self.records(), {
+            ('max_weight', 120): (2, 120),
+            ('estimated_1rm', 120): (2, 128),
+            ('max_reps', 100): (8, 8),
+            ('max_reps', 80): (12, 12),
+            ('max_reps', 110): (3, 3),
+            ('max_reps', 120): (2, 2),
+        })
+
+    # Test that deleting the set holding a record recomputes it from the remaining sets
+    def test_delete_record_set(self):
+        sets = self.create_sets([(100, 5), (90, 5), (100, 5)]).data
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[0]['id']}))
+
+        records = PersonalRecord.objects.filter(exercise=self.exercise)
+        self.assertEqual({record.kind: record.set_id for record in records.filter(weight=100)},
+                         {'max_weight': sets[2]['id'], 'estimated_1rm': sets[2]['id'], 'max_reps': sets[2]['id']})
+
+        # The last set at a weight takes its max_reps record with it
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[1]['id']}))
+        self.assertFalse(records.filter(weight=90).exists())
+
+    # Test that deleting a set holding no record leaves the records alone
+    def test_delete_other_set(self):
+        self.create_sets([(100, 5), (90, 5)])
+        self.create_sets([(90, 4)])
+        set_id = Set.objects.get(weight=90, reps=4).id
+        records = list(PersonalRecord.objects.order_by('id').values())
+
+        self.client.delete(reverse('delete-set', kwargs={'set_id': set_id}))
+        self.assertEqual(list(PersonalRecord.objects.order_by('id').values()), records)
+
+    def test_filter_by_exercise(self):
+        self.create_sets([(100, 5)])
+        response = self.client.get(reverse('personal-records'), {'exercise': self.exercise.id + 1})
+        self.assertEqual(response.data, [])
+        response = self.client.get(reverse('personal-records'), {'exercise': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that a rebuild from history gives the records the write paths keep
+    def test_rebuild(self):
+        sets = self.create_sets([(100, 5), (80, 12), (100, 8), (60, 20)]).data
+        self.create_sets([(105, 2), (80, 12)])
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[1]['id']}))
+        fields = ('exercise', 'set', 'kind', 'weight', 'reps', 'value', 'achieved_at')
+        records = sorted(PersonalRecord.objects.values_list(*fields))
+
+        call_command('rebuild_personal_records', stdout=StringIO())
+        self.assertEqual(sorted(PersonalRecord.objects.values_list(*fields)), records)
+
+
+class VolumeRollupTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+
+    def create_sets(self, sets):
+        url = reverse('create-get-sets', kwargs={'exercise_id': self.exercise.id})
+        return self.client.post(url, data=[{'weight': weight, 'reps': reps} for weight, reps in sets], format='json')
+
+    def rollups(self, period):
+        return list(VolumeRollup.objects.filter(period=period).values_list('volume', 'set_count', 'top_weight'))
+
+    # Test that created and deleted sets are added to and removed from their rollups
+    def test_write_paths(self):
+        sets = self.create_sets([(100, 5), (120, 2)]).data + self.create_sets([(80, 10)]).data
+        self.assertEqual(self.rollups('day'), [(1540, 3, 120)])
+        self.assertEqual(self.rollups('week'), [(1540, 3, 120)])
+
+        # Deleting the heaviest set recomputes the top weight from the remaining sets
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[1]['id']}))
+        self.assertEqual(self.rollups('day'), [(1300, 2, 100)])
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[0]['id']}))
+        self.assertEqual(self.rollups('week'), [(800, 1, 80)])
+
+        # Deleting the last set of a bucket deletes its rollups
+        self.client.delete(reverse('delete-set', kwargs={'set_id': sets[2]['id']}))
+        self.assertFalse(VolumeRollup.objects.exists())
+
+    # Test that reconciling creates missing rollups, corrects wrong ones and deletes extra ones
+    def test_reconcile(self):
+        self.create_sets([(100, 5), (120, 2)])
+        rollups = sorted(VolumeRollup.objects.values_list('period', 'bucket', 'volume', 'set_count', 'top_weight'))
+
+        VolumeRollup.objects.filter(period='day').update(volume=1)
+        VolumeRollup.objects.filter(period='week').delete()
+        VolumeRollup.objects.create(user=self.user, exercise=self.exercise, period='day', bucket='2020-01-01',
+                                    volume=100, set_count=1, top_weight=100)
+        out = StringIO()
+        call_command('reconcile_volume_rollups', stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'Created 1, updated 1 and deleted 1 volume rollups')
+        self.assertEqual(sorted(VolumeRollup.objects.values_list(
+            'period', 'bucket', 'volume', 'set_count', 'top_weight')), rollups)
+
+    # Test that past buckets are read from the rollups and the current one from the sets
+    def test_volume_view(self):
+        self.create_sets([(100, 5), (120, 2)])
+        two_weeks_ago = timezone.now() - timedelta(days=14)
+        Set.objects.filter(weight=120).update(created_at=two_weeks_ago)
+        call_command('reconcile_volume_rollups', stdout=StringIO())
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('training-volume'), {'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['volume'], row['set_count'], row['top_weight']) for row in response.data],
+                         [(240, 1, 120), (500, 1, 100)])
+        self.assertEqual(response.data[1]['bucket'], str(timezone.localdate() - timedelta(
+            days=timezone.localdate().weekday())))
+
+        # Rollups of the current bucket are ignored, so it is never counted twice
+        self.assertEqual(VolumeRollup.objects.filter(period='week').count(), 2)
+
+        # The range only covers the buckets it overlaps
+        response = self.client.get(reverse('training-volume'), {'period': 'day', 'end': str(two_weeks_ago.date())})
+        self.assertEqual([row['volume'] for row in response.data], [240])
+        response = self.client.get(reverse('training-volume'), {'exercise': self.exercise.id + 1})
+        self.assertEqual(response.data, [])
+
+    def test_volume_view_invalid_query(self):
+        for query in ({'period': 'month'}, {'start': '2024-02-01', 'end': '2024-01-01'}, {'start': 'yesterday'}):
+            response = self.client.get(reverse('training-volume'), query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConcurrentWorkoutUpdateTest(APITransactionTestCase):
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.workout = Workout.objects.create(user=self.user, name='test workout')
+        self.kept = Exercise.objects.create(user=self.user, workout=self.workout, name='kept',
+                                            current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+
+    # Test that concurrent edits of a workout are applied one after another, so the workout
+    # ends up with the exercises of one of them rather than a mix of both
+    def test_concurrent_updates(self):
+        names = ['first', 'second', 'third', 'fourth']
+        barrier = threading.Barrier(len(names))
+        responses = []
+
+        def update(name):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            exercises = [
+                {'id': self.kept.id, 'name': 'kept', 'current_weight': 100, 'target_sets': 3, 'target_reps': 10,
+                 'weight_modifier': 5},
+                {'name': name, 'current_weight': 50, 'target_sets': 3, 'target_reps': 10, 'weight_modifier': 5},
+            ]
+            barrier.wait()
+            try:
+                responses.append(client.put(reverse('modify-delete-workout', kwargs={'workout_id': self.workout.id}),
+                                            data={'exercises': exercises}, format='json'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=update, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * len(names))
+        exercise_names = set(Exercise.objects.filter(workout=self.workout).values_list('name', flat=True))
+        self.assertEqual(len(exercise_names), 2)
+        self.assertIn('kept', exercise_names)
+
+
+class ConcurrentSetDeleteTest(APITransactionTestCase):
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        client.post(reverse('create-get-sets', kwargs={'exercise_id': self.exercise.id}),
+                    data=[{'weight': 100, 'reps': 10}, {'weight': 80, 'reps': 10}], format='json')
+        self.set = Set.objects.filter(exercise=self.exercise).order_by('id').first()
+
+    # Test that racing deletions of the same set delete it once, and take it out of the
+    # rollups once
+    def test_concurrent_deletes(self):
+        request_count = 4
+        barrier = threading.Barrier(request_count)
+        responses = []
+
+        def delete():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            barrier.wait()
+            try:
+                responses.append(client.delete(reverse('delete-set', kwargs={'set_id': self.set.id})))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=delete) for _ in range(request_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(response.status_code for response in responses),
+                         [status.HTTP_204_NO_CONTENT] + [status.HTTP_404_NOT_FOUND] * (request_count - 1))
+        self.assertEqual(Tombstone.objects.filter(model='set', object_id=self.set.id).count(), 1)
+        for rollup in VolumeRollup.objects.filter(exercise=self.exercise):
+            self.assertEqual((rollup.volume, rollup.set_count, rollup.top_weight), (800, 1, 80))
+
+
+class ConcurrentProgressionTest(APITransactionTestCase):
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        Set.objects.create(user=self.user, exercise=self.exercise, weight=100, reps=10)
+
+    # Test that requests racing to progress the same session progress it exactly once
+    def test_concurrent_requests(self):
+        request_count = 4
+        barrier = threading.Barrier(request_count)
+        responses = []
+
+        def progress():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            barrier.wait()
+            try:
+                responses.append(client.put(reverse('progress-exercises'),
+                                            data={'exercises': [self.exercise.id]}, format='json'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=progress) for _ in range(request_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * request_count)
+        self.assertEqual(sum(len(response.data) for response in responses), 1)
+        self.exercise.refresh_from_db()
+        self.assertEqual(self.exercise.current_weight, 105)
+
+
+class ConcurrentRecordRebuildTest(APITransactionTestCase):
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        self.exercise = Exercise.objects.create(user=self.user, workout=workout, name='exercise',
+                                                current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        client.post(reverse('create-get-sets', kwargs={'exercise_id': self.exercise.id}),
+                    data=[{'weight': 100, 'reps': 5}], format='json')
+
+    # Test that a set created while the records are rebuilt is not lost, whichever of the two
+    # commits first
+    def test_set_during_rebuild(self):
+        deleted = threading.Event()
+        responses = []
+
+        def delayed_rebuild_records(sets, batch_size):
+            deleted.set()
+            # Give the set time to be written while the records are deleted
+            time.sleep(0.5)
+            return rebuild_records(sets, batch_size)
+
+        def rebuild():
+            try:
+                with mock.patch('workouts.management.commands.rebuild_personal_records.rebuild_records',
+                                delayed_rebuild_records):
+                    call_command('rebuild_personal_records', stdout=StringIO())
+            finally:
+                deleted.set()
+                connection.close()
+
+        def create_set():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            deleted.wait()
+            try:
+                responses.append(client.post(reverse('create-get-sets', kwargs={'exercise_id': self.exercise.id}),
+                                             data=[{'weight': 120, 'reps': 5}], format='json'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rebuild), threading.Thread(target=create_set)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(responses[0].status_code, status.HTTP_201_CREATED)
+        record = PersonalRecord.objects.get(exercise=self.exercise, kind='max_weight')
+        self.assertEqual(record.weight, 120)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Index usage is checked with Postgres EXPLAIN')
+class IndexUsageTest(WorkoutBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # The test tables are tiny, so keep the planner from preferring other scans
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def test_recent_sets_use_covering_index(self):
+        sets = Set.objects.filter(user=self.user, created_at__gte=timezone.now() - timedelta(hours=4))
+        plan = sets.values('id', 'exercise', 'weight', 'reps', 'created_at').explain()
+        self.assertIn('Index Only Scan using set_user_created_idx', plan)
+
+    def test_exercise_sets_use_index(self):
+        workout = Workout.objects.create(user=self.user, name='test workout')
+        exercise = Exercise.objects.create(user=self.user, workout=workout, name='test exercise',
+                                           current_weight=100, target_sets=3, target_reps=10, weight_modifier=5)
+        plan = Set.objects.filter(exercise=exercise).order_by('created_at').explain()
+        self.assertIn('set_exercise_created_idx', plan)
+
+    def test_workout_exercises_use_index(self):
+        plan = Exercise.objects.filter(user=self.user, workout_id=1).explain()
+        self.assertIn('exercise_user_workout_idx', plan)
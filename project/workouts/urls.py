@@ -10,6 +10,10 @@ urlpatterns = [
     path('sets/<int:set_id>/', SetDeleteAPIView.as_view(), name='delete-set'),
     path('summary/', WorkoutSummaryAPIView.as_view(), name='workout-summary'),
     path('progress/', ExerciseProgressionAPIView.as_view(), name='progress-exercises'),
+    path('export/', SetExportView.as_view(), name='export-sets'),
+    path('sync/', SyncAPIView.as_view(), name='sync'),
+    path('records/', PersonalRecordsAPIView.as_view(), name='personal-records'),
+    path('volume/', VolumeAPIView.as_view(), name='training-volume'),
 
     # Admin functions
     path('workouts-list/', WorkoutListAPIView.as_view(), name='workouts-list'),
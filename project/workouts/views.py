@@ -1,21 +1,37 @@
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
+from .cache import bump_generation, cache_per_user
+from .conditional import conditional
+from .records import held_records, lock_records, recompute_records, record_sets
+from .rollups import add_sets, bucket_at, bucket_of, bucket_range, bucket_totals, remove_set
 from .serializers import *
-from datetime import timedelta
+from datetime import datetime, timedelta
+import csv
+import json
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import (Count, DateTimeField, ExpressionWrapper, F, Max, OuterRef, Prefetch, Q, Subquery,
+                              Sum)
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from authentication.authentication import CachedTokenAuthentication
+from project.db import oldest_transaction_start
+from project.routers import read_from_primary
+from project.pagination import CreatedAtCursorPagination, IdCursorPagination
 
 
 class CreateWorkoutView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         data = request.data
-        data['user'] = request.user.id
 
         # Check if 'name' exists in the request data
         if 'name' not in data:
@@ -26,59 +42,92 @@ class CreateWorkoutView(APIView):
         if not exercises:
             return Response({'error': 'Exercises are missing'}, status=status.HTTP_400_BAD_REQUEST)
 
+        workout_serializer = WorkoutWriteSerializer(data=data)
+        if not workout_serializer.is_valid():
+            return Response(workout_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validate all exercises in a single pass before writing anything
+        exercise_serializer = ExerciseWriteSerializer(data=exercises, many=True)
+        if not exercise_serializer.is_valid():
+            return Response(exercise_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            # Create new workout
-            workout_serializer = WorkoutSerializer(data=data)
-            if workout_serializer.is_valid():
-                workout = workout_serializer.save()
-
-                # Create exercises for the workout
-                exercises = data.get('exercises', [])
-                for exercise_data in exercises:
-                    exercise_data['workout'] = workout.id
-                    exercise_data['user'] = request.user.id
-                    exercise_serializer = ExerciseSerializer(
-                        data=exercise_data)
-                    if exercise_serializer.is_valid():
-                        exercise_serializer.save()
-                    else:
-                        return Response(exercise_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                return Response(workout_serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(exercise_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # Create the workout and all of its exercises in one transaction
+            with transaction.atomic():
+                workout = workout_serializer.save(user=request.user)
+                created_exercises = Exercise.objects.bulk_create([
+                    Exercise(user=request.user, workout=workout, **exercise_data)
+                    for exercise_data in exercise_serializer.validated_data
+                ])
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        bump_generation(request.user.id)
+
+        response_data = dict(workout_serializer.data)
+        response_data['exercises'] = ExerciseSerializer(
+            created_exercises, many=True).data
+        return Response(response_data, status=status.HTTP_201_CREATED)
 
 
 class MyWorkoutsView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    expandable = {'exercises', 'last_session'}
+
+    @cache_per_user
     def get(self, request):
         user_id = request.user.id
         workouts = Workout.objects.filter(user_id=user_id)
-        serializer = WorkoutSerializer(workouts, many=True)
+
+        expand = {name for name in request.query_params.get('expand', '').split(',') if name}
+        if not expand:
+            return Response(workout_values_serializer.many(workouts))
+        if not expand <= self.expandable:
+            return Response({'error': f'expand must be a subset of {sorted(self.expandable)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # The last session needs the exercises it belongs to
+        expand.add('exercises')
+
+        # One query per level, however many workouts and exercises there are
+        exercises = Exercise.objects.order_by('id')
+        if 'last_session' in expand:
+            exercises = exercises.prefetch_related(
+                Prefetch('set_set', queryset=self.last_session_sets(), to_attr='last_session'))
+        workouts = workouts.order_by('id').prefetch_related(
+            Prefetch('exercise_set', queryset=exercises, to_attr='exercises'))
+
+        serializer = ExpandedWorkoutSerializer(workouts, many=True, expand=expand)
         return Response(serializer.data)
 
+    # Sets performed within four hours of their exercise's latest set
+    @staticmethod
+    def last_session_sets():
+        latest = Set.objects.filter(exercise=OuterRef('exercise')).order_by('-created_at').values('created_at')[:1]
+        session_start = ExpressionWrapper(Subquery(latest) - timedelta(hours=4), output_field=DateTimeField())
+        return Set.objects.alias(session_start=session_start).filter(
+            created_at__gte=F('session_start')).order_by('created_at', 'id')
+
 
 class WorkoutExercisesView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user
     def get(self, request, workout_id):
         try:
             exercises = Exercise.objects.filter(
                 user_id=request.user.id, workout_id=workout_id)
-            exercise_serializer = ExerciseSerializer(exercises, many=True)
-            if exercise_serializer.data == []:
+            exercise_data = exercise_values_serializer.many(exercises)
+            if exercise_data == []:
                 return Response({'error': 'No exercises found for this workout'}, status=status.HTTP_404_NOT_FOUND)
-            return Response(exercise_serializer.data, status=status.HTTP_200_OK)
+            return Response(exercise_data, status=status.HTTP_200_OK)
         except Workout.DoesNotExist:
             return Response([], status=status.HTTP_200_OK)
 
 
 class WorkoutUpdateDeleteView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = WorkoutSerializer
 
@@ -94,29 +143,91 @@ class WorkoutUpdateDeleteView(APIView):
         except Workout.DoesNotExist:
             return Response({'error': 'Workout not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Update workout name
-        name = request.data.get('name', None)
-        if name:
-            workout.name = name
-            workout.save()
-
-        # Delete existing exercises for the workout
-        Exercise.objects.filter(workout_id=workout_id,
-                                user_id=user_id).delete()
-
-        # Insert the updated exercises
-        exercises = request.data.get('exercises', [])
-        if exercises:
-            for exercise_data in exercises:
-                exercise_data['user'] = user_id
-                exercise_data['workout'] = workout_id
-                exercise_serializer = ExerciseSerializer(data=exercise_data)
-                if exercise_serializer.is_valid():
-                    exercise_serializer.save()
-                else:
-                    return Response(exercise_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Validate the updated exercises in a single pass
+        exercises = request.data.get('exercises')
+        if exercises is not None:
+            exercise_serializer = ExerciseUpdateSerializer(
+                data=exercises, many=True)
+            if not exercise_serializer.is_valid():
+                return Response(exercise_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # Lock the workout, so concurrent edits of it are applied one after another, each
+            # to the exercises the previous one left
+            workout = Workout.objects.select_for_update().filter(id=workout.id).first()
+            if workout is None:
+                return Response({'error': 'Workout not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            # Update workout name
+            name = request.data.get('name', None)
+            if name and name != workout.name:
+                workout.name = name
+                workout.save(update_fields=['name', 'updated_at'])
+
+            if exercises is not None:
+                error = self.reconcile_exercises(
+                    request, workout, exercise_serializer.validated_data)
+                if error is not None:
+                    transaction.set_rollback(True)
+                    return error
+        bump_generation(user_id)
+
         return Response({'message': 'Workout modified successfully'})
 
+    # Bring the workout's exercises in line with the updated ones, returning an error response
+    # if an exercise does not belong to the workout
+    def reconcile_exercises(self, request, workout, updated_exercises):
+        existing_exercises = {
+            exercise.id: exercise
+            for exercise in Exercise.objects.select_for_update().filter(workout=workout, user=request.user)
+        }
+
+        # Sort the exercises into new ones and changed existing ones, keeping track of
+        # every field that changed so only those columns are updated
+        exercises_to_create = []
+        exercises_to_update = []
+        changed_fields = set()
+        kept_ids = set()
+        for exercise_data in updated_exercises:
+            exercise_id = exercise_data.pop('id', None)
+            if exercise_id is None:
+                exercises_to_create.append(
+                    Exercise(user=request.user, workout=workout, **exercise_data))
+                continue
+
+            exercise = existing_exercises.get(exercise_id)
+            if exercise is None or exercise_id in kept_ids:
+                return Response({'error': f'Exercise {exercise_id} not found in this workout'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            kept_ids.add(exercise_id)
+
+            changed = [field for field, value in exercise_data.items()
+                       if getattr(exercise, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(exercise, field, exercise_data[field])
+                exercises_to_update.append(exercise)
+                changed_fields.update(changed)
+
+        # Only delete the exercises that were left out, so the others keep their sets
+        removed_ids = existing_exercises.keys() - kept_ids
+        if removed_ids:
+            Exercise.objects.filter(id__in=removed_ids).delete()
+            Tombstone.objects.bulk_create([
+                Tombstone(user=request.user, model='exercise', object_id=exercise_id)
+                for exercise_id in removed_ids
+            ])
+        if exercises_to_update:
+            # bulk_update() does not touch auto_now fields by itself
+            updated_at = timezone.now()
+            for exercise in exercises_to_update:
+                exercise.updated_at = updated_at
+            Exercise.objects.bulk_update(
+                exercises_to_update, sorted(changed_fields) + ['updated_at'])
+        if exercises_to_create:
+            Exercise.objects.bulk_create(exercises_to_create)
+        return None
+
     def delete(self, request, workout_id):
         user_id = request.user.id
 
@@ -126,15 +237,19 @@ class WorkoutUpdateDeleteView(APIView):
             return Response({'error': 'Workout not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # Delete the workout
-        workout.delete()
+        with transaction.atomic():
+            Tombstone.objects.create(user=request.user, model='workout', object_id=workout.id)
+            workout.delete()
+        bump_generation(user_id)
 
         return Response({'message': 'Workout and exercises deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
 class SetsAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user
     def get(self, request, exercise_id):
         # Check if exercise_id is present
         if exercise_id is None:
@@ -143,8 +258,7 @@ class SetsAPIView(APIView):
         try:
             exercise = Exercise.objects.get(id=exercise_id, user=request.user)
             sets = Set.objects.filter(exercise=exercise)
-            set_serializer = SetSerializer(sets, many=True)
-            return Response(set_serializer.data, status=status.HTTP_200_OK)
+            return Response(set_values_serializer.many(sets), status=status.HTTP_200_OK)
         except Exercise.DoesNotExist:
             return Response({'error': 'Exercise not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -156,108 +270,194 @@ class SetsAPIView(APIView):
 
         sets_data = request.data
 
-        # Create sets for the exercise
-        sets_created = []
+        # Check that the sets fit in a single batch
+        max_sets = settings.WORKOUTS_MAX_SETS_PER_REQUEST
+        if isinstance(sets_data, list) and len(sets_data) > max_sets:
+            return Response({'error': f'No more than {max_sets} sets can be created at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         try:
             # Retrieve the exercise by ID and the current user
             exercise = Exercise.objects.get(id=exercise_id, user=request.user)
         except Exercise.DoesNotExist:
             return Response({'error': 'Exercise not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        for set_data in sets_data:
-            # Include the exercise ID and user ID in the set data
-            set_data['exercise'] = exercise.id
-            set_data['user'] = request.user.id
+        # Validate all sets in a single pass
+        set_serializer = SetWriteSerializer(data=sets_data, many=True)
+        if not set_serializer.is_valid():
+            return Response(set_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            set_serializer = SetSerializer(data=set_data)
-            if set_serializer.is_valid():
-                set_serializer.save()
-                sets_created.append(set_serializer.data)
-            else:
-                return Response(set_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        return Response(sets_created, status=status.HTTP_201_CREATED)
+        # Create sets for the exercise
+        with transaction.atomic():
+            sets_created = Set.objects.bulk_create(
+                [Set(user=request.user, exercise=exercise, **set_data)
+                 for set_data in set_serializer.validated_data],
+                batch_size=settings.WORKOUTS_SETS_BATCH_SIZE,
+            )
+            record_sets(exercise.id, sets_created)
+            add_sets(request.user.id, exercise.id, sets_created)
+        bump_generation(request.user.id)
+        return Response(SetSerializer(sets_created, many=True).data, status=status.HTTP_201_CREATED)
 
 
 class SetDeleteAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, set_id):
-        try:
-            # Find the set with the specified setid and belonging to the current user
-            set_to_delete = Set.objects.get(
-                id=set_id, user=request.user)
+        with transaction.atomic():
+            # Lock the set's exercise like the other set write paths, then read the set again,
+            # so a concurrent or retried deletion of the same set finds it gone
+            exercise_id = Set.objects.filter(id=set_id, user=request.user).values_list(
+                'exercise_id', flat=True).first()
+            if exercise_id is not None:
+                lock_records(exercise_id)
+            set_to_delete = Set.objects.filter(id=set_id, user=request.user).first()
+            if set_to_delete is None:
+                return Response({'error': 'Set not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            # Deleting the set deletes its records, which are recomputed from the remaining sets
+            records = held_records(set_to_delete)
+            Tombstone.objects.create(user=request.user, model='set', object_id=set_to_delete.id)
             set_to_delete.delete()
-            return Response({'message': 'Set deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
-        except Set.DoesNotExist:
-            return Response({'error': 'Set not found'}, status=status.HTTP_404_NOT_FOUND)
+            if records:
+                recompute_records(set_to_delete.exercise_id, records)
+            remove_set(set_to_delete)
+        bump_generation(request.user.id)
+        return Response({'message': 'Set deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class WorkoutSummaryAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+# The user's personal records, read from the table the set write paths keep up to date
+class PersonalRecordsAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user
     def get(self, request):
-        four_hours_ago = timezone.now() - timedelta(hours=4)
+        records = PersonalRecord.objects.filter(user=request.user)
 
-        # Retrieve all sets performed by the user in the last 4 hours
-        sets = Set.objects.filter(
-            user=request.user, created_at__gte=four_hours_ago)
+        # Optionally only the records of one exercise
+        exercise_id = request.query_params.get('exercise')
+        if exercise_id is not None:
+            if not exercise_id.isdigit():
+                return Response({'error': 'exercise must be an exercise id'}, status=status.HTTP_400_BAD_REQUEST)
+            records = records.filter(exercise_id=exercise_id)
 
-        # Organize the sets by exercise
-        exercise_sets = {}
-        for set_data in sets:
-            exercise_name = set_data.exercise.name
-            if exercise_name not in exercise_sets:
-                exercise_sets[exercise_name] = []
-            serialized_set = SetSerializer(set_data).data
-            exercise_sets[exercise_name].append(serialized_set)
+        records = records.order_by('exercise_id', 'kind', 'weight')
+        return Response(personal_record_values_serializer.many(records), status=status.HTTP_200_OK)
 
-        return Response(exercise_sets, status=status.HTTP_200_OK)
 
+# Training volume per exercise and day or week, read from the rollups the set write paths keep
+# up to date. Only the current bucket, still filling up, is totalled from the sets themselves.
+class VolumeAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
-class ExerciseProgressionAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    def get(self, request):
+        query = VolumeQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        period, start, end = (query.validated_data[name] for name in ('period', 'start', 'end'))
+        exercise_id = query.validated_data.get('exercise')
+
+        # The buckets overlapping the range, up to the current one
+        first = bucket_of(period, start)
+        current = bucket_at(period, timezone.now())
+        rollups = VolumeRollup.objects.filter(user=request.user, period=period, bucket__gte=first,
+                                              bucket__lte=end, bucket__lt=current)
+        sets = Set.objects.filter(user=request.user, created_at__gte=bucket_range(period, current)[0])
+        if exercise_id is not None:
+            rollups = rollups.filter(exercise_id=exercise_id)
+            sets = sets.filter(exercise_id=exercise_id)
+        rows = list(rollups.order_by('exercise_id', 'bucket').values(*volume_values_serializer.value_names))
+
+        if first <= current <= end:
+            rows += [
+                {'exercise': row['exercise_id'], **{name: row[name] for name in VOLUME_FIELDS}}
+                for row in bucket_totals(sets, period)
+            ]
+            rows.sort(key=lambda row: (row['exercise'], row['bucket']))
+        return Response(volume_values_serializer.rows(rows), status=status.HTTP_200_OK)
+
+
+# Validators of the views built from the user's sets of the last 4 hours. Sets deleted or
+# leaving the window change the count, so the ETag changes even though no row was modified.
+# Neither leaves a time behind, so the views send no Last-Modified.
+def recent_sets_validators(request, *args, **kwargs):
+    four_hours_ago = timezone.now() - timedelta(hours=4)
+    recent_sets = Set.objects.filter(user=request.user, created_at__gte=four_hours_ago).aggregate(
+        count=Count('id'),
+        last_created=Max('created_at'),
+        last_exercise_update=Max('exercise__updated_at'),
+    )
+
+    parts = (request.user.id, recent_sets['count'], recent_sets['last_created'],
+             recent_sets['last_exercise_update'])
+    return parts, None
+
+
+class WorkoutSummaryAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    # Get all exercises performed in the last 4 hours that are eligible for progression
+    @conditional(recent_sets_validators)
     def get(self, request):
-        # Get the datetime 4 hours ago
         four_hours_ago = timezone.now() - timedelta(hours=4)
 
-        # Retrieve the sets performed in the last 4 hours
+        # Retrieve all sets performed by the user in the last 4 hours
         sets = Set.objects.filter(
             user=request.user, created_at__gte=four_hours_ago)
 
-        # Initialize list to store results
-        eligible_exercises = []
+        # Organize the sets by exercise, reading the exercise name in the same query
+        exercise_sets = {}
+        set_rows = list(sets.order_by('created_at', 'id').values(
+            *set_values_serializer.value_names, 'exercise__name'))
+        for set_row, set_data in zip(set_rows, set_values_serializer.rows(set_rows)):
+            exercise_sets.setdefault(set_row['exercise__name'], []).append(set_data)
 
-        # Loop through each exercise to determine if each goal has been met
-        for set in sets:
-            exercise = set.exercise
+        # Optionally include per exercise totals, computed by the database
+        if request.query_params.get('aggregates') not in ('true', '1'):
+            return Response(exercise_sets, status=status.HTTP_200_OK)
 
-            # Check if the exercise is already added to eligible exercises list
-            if exercise.id in eligible_exercises:
-                continue
+        exercise_aggregates = sets.order_by().values('exercise__name').annotate(
+            total_volume=Sum(F('weight') * F('reps')),
+            max_weight=Max('weight'),
+            set_count=Count('id'),
+        )
+        aggregates = {
+            row.pop('exercise__name'): row for row in exercise_aggregates
+        }
 
-            # Get all sets for this exercise performed in the last 4 hours
-            exercise_sets = sets.filter(exercise=exercise)
+        return Response({'sets': exercise_sets, 'aggregates': aggregates}, status=status.HTTP_200_OK)
 
-            # Check if all sets meet the criteria
-            all_sets_meet_criteria = all(
-                s.weight >= exercise.current_weight and s.reps >= exercise.target_reps
-                for s in exercise_sets
-            )
 
-            # Check if the exercise meets the progression criteria
-            if (
-                all_sets_meet_criteria
-                and exercise.target_sets <= exercise_sets.count()
-            ):
-                eligible_exercises.append(exercise.id)
+class ExerciseProgressionAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # Get all exercises performed in the last 4 hours that are eligible for progression
+    @conditional(recent_sets_validators)
+    def get(self, request):
+        # Get the datetime 4 hours ago
+        four_hours_ago = timezone.now() - timedelta(hours=4)
 
-        # Retrieve the eligible exercises
-        exercises = Exercise.objects.filter(id__in=eligible_exercises)
+        # Only consider sets performed by the user in the last 4 hours
+        recent_sets = Q(set__user=request.user,
+                        set__created_at__gte=four_hours_ago)
+
+        # Count every recent set per exercise, and the ones meeting the weight and rep goals,
+        # so eligibility is decided by a single grouped query
+        exercises = Exercise.objects.filter(user=request.user).annotate(
+            recent_set_count=Count('set', filter=recent_sets),
+            passing_set_count=Count('set', filter=recent_sets & Q(
+                set__weight__gte=F('current_weight'),
+                set__reps__gte=F('target_reps'),
+            )),
+        ).filter(
+            recent_set_count__gt=0,
+            recent_set_count=F('passing_set_count'),
+            recent_set_count__gte=F('target_sets'),
+        )
 
         # Serialize the exercises
         exercise_serializer = ExerciseSerializer(exercises, many=True)
@@ -266,35 +466,221 @@ class ExerciseProgressionAPIView(APIView):
     
     def put(self, request):
         # Get the exercise_ids from the request
-        exercises_to_progress = request.data.get('exercises', [])
+        progression_serializer = ProgressionSerializer(data=request.data)
+        if not progression_serializer.is_valid():
+            return Response(progression_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        exercises_to_progress = progression_serializer.validated_data['exercises']
+
+        # Increment every exercise in one UPDATE, so concurrent requests cannot lose an increment.
+        # Exercises already progressed since their latest set are skipped, so a retried request
+        # does not progress the same session twice.
+        progressed_at = timezone.now()
+        latest_set = Set.objects.filter(exercise=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+        updated_count = Exercise.objects.filter(
+            Q(last_progressed_at__isnull=True) | Q(last_progressed_at__lt=Subquery(latest_set)),
+            id__in=exercises_to_progress, user=request.user,
+        ).update(
+            current_weight=F('current_weight') + F('weight_modifier'),
+            last_progressed_at=progressed_at,
+            updated_at=progressed_at,
+        )
+
+        if not updated_count:
+            return Response([], status=status.HTTP_200_OK)
+        bump_generation(request.user.id)
+
+        # Return the exercises this request progressed
+        updated_exercises = Exercise.objects.filter(
+            id__in=exercises_to_progress, user=request.user, last_progressed_at=progressed_at).order_by('id')
+        return Response(exercise_values_serializer.many(updated_exercises), status=status.HTTP_200_OK)
+
+# The time up to which a sync sees every change: now, or if earlier, the start of the oldest
+# transaction that has written to the primary and is still open, whose writes carry earlier
+# times but only show once it commits. Rows get their time just before they are written,
+# and a transaction only counts from its first write, both of which
+# WORKOUTS_SYNC_OVERLAP_SECONDS covers. Read-only transactions never hold the point back,
+# while a long writing one, like a management command's, holds it back to its start until
+# it ends. Databases other than Postgres do not report their open transactions, so there
+# the overlap has to cover whole transactions.
+def sync_point():
+    point = timezone.now()
+    oldest = oldest_transaction_start()
+    if oldest is not None:
+        point = min(point, oldest)
+    return point - timedelta(seconds=settings.WORKOUTS_SYNC_OVERLAP_SECONDS)
+
+
+class SyncAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        updated_exercises = []
+    # Rows of each kind, and deletions, the response to a sync holds at most
+    sync_kinds = ('workouts', 'exercises', 'sets', 'deleted')
 
-        # For each exercise in the array, increment
-        for exercise_id in exercises_to_progress:
+    # Get the workouts, exercises and sets created, updated or deleted since the given cursor,
+    # along with the cursor to send next time. Without a cursor everything is returned. Rows
+    # come in pages ordered by id, and while 'more' is true the client asks again right away
+    # with the new cursor. Rows changed while paging come again with the next sync.
+    def get(self, request):
+        # A sync must not miss rows a replica has not caught up with yet
+        read_from_primary()
+        since, point, after = None, None, self.first_page()
+        reset = False
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
             try:
-                exercise = Exercise.objects.get(id=exercise_id, user=request.user)
-                exercise.current_weight += exercise.weight_modifier
-                exercise.save()
-                updated_exercises.append(exercise)
-            except Exercise.DoesNotExist:
-                pass
+                since, point, after = self.load_cursor(cursor)
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Deletions older than the tombstones are unknown, so start over
+            if since is not None and since < timezone.now() - timedelta(days=settings.WORKOUTS_SYNC_TOMBSTONE_DAYS):
+                since, point, after = None, None, self.first_page()
+                reset = True
+
+        # The next sync reads from where the first page of this one started
+        if point is None:
+            point = sync_point()
+
+        workouts = Workout.objects.filter(user=request.user, id__gt=after['workouts'])
+        exercises = Exercise.objects.filter(user=request.user, id__gt=after['exercises'])
+        sets = Set.objects.filter(user=request.user, id__gt=after['sets'])
+        tombstones = Tombstone.objects.none()
+
+        if since is not None:
+            workouts = workouts.filter(updated_at__gt=since)
+            exercises = exercises.filter(updated_at__gt=since)
+            sets = sets.filter(created_at__gt=since)
+            tombstones = Tombstone.objects.filter(user=request.user, deleted_at__gt=since, id__gt=after['deleted'])
+
+        page_size = settings.WORKOUTS_SYNC_PAGE_SIZE
+        rows = {
+            'workouts': workout_values_serializer.many(workouts.order_by('id')[:page_size]),
+            'exercises': exercise_values_serializer.many(exercises.order_by('id')[:page_size]),
+            'sets': set_values_serializer.many(sets.order_by('id')[:page_size]),
+            'deleted': list(tombstones.order_by('id').values('id', 'model', 'object_id')[:page_size]),
+        }
+        deleted = {'workouts': [], 'exercises': [], 'sets': []}
+        for tombstone in rows['deleted']:
+            deleted[tombstone['model'] + 's'].append(tombstone['object_id'])
+
+        more = any(len(page) == page_size for page in rows.values())
+        if more:
+            after = {kind: page[-1]['id'] if page else after[kind] for kind, page in rows.items()}
+            next_cursor = {
+                'since': since.isoformat() if since is not None else None,
+                'point': point.isoformat(),
+                'after': after,
+            }
+        else:
+            next_cursor = {'since': point.isoformat()}
+
+        return Response({
+            'cursor': signing.dumps(next_cursor, salt='workouts.sync'),
+            'more': more,
+            'reset': reset,
+            'workouts': rows['workouts'],
+            'exercises': rows['exercises'],
+            'sets': rows['sets'],
+            'deleted': deleted,
+        }, status=status.HTTP_200_OK)
+
+    # The last id of each kind of row sent so far, before the first page
+    def first_page(self):
+        return dict.fromkeys(self.sync_kinds, 0)
+
+    # The time the cursor reads changes since, None for everything, and while paging, the
+    # sync point of the first page and the last id of each kind of row sent so far
+    def load_cursor(self, cursor):
+        payload = signing.loads(cursor, salt='workouts.sync')
+        since = datetime.fromisoformat(payload['since']) if payload['since'] is not None else None
+        if 'after' not in payload:
+            return since, None, self.first_page()
+        after = {kind: int(payload['after'][kind]) for kind in self.sync_kinds}
+        return since, datetime.fromisoformat(payload['point']), after
+
+
+# Pseudo-buffer handing each row written by csv.writer straight back to the caller
+class Echo:
+    def write(self, value):
+        return value
+
+
+class SetExportView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        # Serialize the updated exercises and return them
-        exercise_serializer = ExerciseSerializer(updated_exercises, many=True)
+    # Columns of each exported set
+    columns = ['id', 'workout_id', 'workout', 'exercise_id', 'exercise', 'weight', 'reps', 'created_at']
+
+    # Renders the timestamps of both formats
+    encoder = DjangoJSONEncoder()
+
+    # Stream all of the user's sets as NDJSON or CSV, without loading them all in memory
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response({'error': 'output must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the sets in chunks, through a server-side cursor on Postgres. Named rows, since
+        # aiterator() cannot read plain values_list() rows in Django 5.2.
+        rows = Set.objects.filter(user=request.user).order_by('created_at', 'id').values_list(
+            'id', 'exercise__workout_id', 'exercise__workout__name', 'exercise_id', 'exercise__name',
+            'weight', 'reps', 'created_at', named=True,
+        )
+
+        if output == 'csv':
+            writer = csv.writer(Echo())
+            header, encode = [writer.writerow(self.columns)], writer.writerow
+        else:
+            header, encode = [], self.encode_ndjson
+
+        # Under ASGI the response is sent from the event loop, which reads a sync iterator whole
+        # into memory before sending anything, so the rows are read asynchronously there
+        chunk_size = settings.WORKOUTS_EXPORT_CHUNK_SIZE
+        if isinstance(request._request, ASGIRequest):
+            content = self.astream(header, encode, rows.aiterator(chunk_size=chunk_size))
+        else:
+            content = self.stream(header, encode, rows.iterator(chunk_size=chunk_size))
+
+        content_type = 'text/csv' if output == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="sets.{output}"'
+        return response
+
+    def stream(self, header, encode, rows):
+        yield from header
+        for row in rows:
+            yield encode(self.export_row(row))
+
+    async def astream(self, header, encode, rows):
+        for line in header:
+            yield line
+        async for row in rows:
+            yield encode(self.export_row(row))
+
+    # The row with its timestamp rendered as in JSON, so both formats agree
+    def export_row(self, row):
+        return row[:-1] + (self.encoder.default(row[-1]),)
+
+    def encode_ndjson(self, row):
+        return json.dumps(dict(zip(self.columns, row))) + '\n'
 
-        return Response(exercise_serializer.data, status=status.HTTP_200_OK)
 
 class WorkoutListAPIView(ListAPIView):
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    pagination_class = CreatedAtCursorPagination
 
 
 class ExerciseListAPIView(ListAPIView):
     queryset = Exercise.objects.all()
     serializer_class = ExerciseSerializer
+    pagination_class = IdCursorPagination
 
 
 class SetListAPIView(ListAPIView):
     queryset = Set.objects.all()
     serializer_class = SetSerializer
+    pagination_class = CreatedAtCursorPagination